@@ -0,0 +1,131 @@
+import pygame
+import io
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+# Kinds of manifest entry
+IMAGE = "image"
+SOUND = "sound"
+
+
+class AssetManager:
+    """ Loads every image once and converts it to the display's pixel format,
+    so blits don't convert pixels on the fly. Surfaces made at runtime can be
+    tracked too, and report() adds up the memory held by each category.
+    Tracking doesn't keep a surface alive, so the report only counts what is
+    still in use.
+
+    preload() reads and decodes a manifest of (kind, path, category) entries
+    on worker threads. Asking for an asset that is still loading waits for
+    it, and finish() waits for all of them. """
+
+    def __init__(self, workers=4):
+        self.images = {}
+        self.sounds = {}
+        self.surfaces = {}
+        self.rotation_caches = weakref.WeakSet()
+        self.scale_caches = weakref.WeakSet()
+        self.workers = workers
+        self.executor = None
+        self.pending = {}
+
+    def preload(self, manifest):
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="assets")
+        for kind, path, category in manifest:
+            if path in self.images or path in self.sounds or path in self.pending:
+                continue
+            read = self.read_image if kind == IMAGE else self.read_sound
+            self.pending[path] = (kind, category, self.executor.submit(read, path))
+
+    def ready(self):
+        return all(future.done() for _, _, future in self.pending.values())
+
+    def finish(self):
+        """ Waits for every preload, then converts the images, which has to
+        happen on the main thread """
+        for path, (kind, category, _) in list(self.pending.items()):
+            if kind == IMAGE:
+                self.image(path, category)
+            else:
+                self.sound(path)
+
+    @staticmethod
+    def read_image(path):
+        return pygame.image.load(path)
+
+    @staticmethod
+    def read_sound(path):
+        with open(path, "rb") as f:
+            data = f.read()
+        return pygame.mixer.Sound(file=io.BytesIO(data))
+
+    def take_pending(self, path):
+        if path not in self.pending:
+            return None
+        return self.pending.pop(path)[2].result()
+
+    def image(self, path, category="images"):
+        if path not in self.images:
+            surface = self.take_pending(path)
+            if surface is None:
+                surface = self.read_image(path)
+            self.images[path] = self.track(self.convert(surface), category)
+        return self.images[path]
+
+    def sound(self, path):
+        if path not in self.sounds:
+            sound = self.take_pending(path)
+            if sound is None:
+                sound = pygame.mixer.Sound(path)
+            self.sounds[path] = sound
+        return self.sounds[path]
+
+    def convert(self, surface):
+        """ Matches the display's pixel format, keeping per-pixel alpha if
+        the surface has it. Without a display there is nothing to match.
+
+        A paletted image's colorkey marks a palette index, and other indices
+        can share its color, so keyed images are given an alpha channel too
+        rather than being keyed by color. """
+        if pygame.display.get_surface() is None:
+            return surface
+        if surface.get_flags() & pygame.SRCALPHA or surface.get_colorkey() is not None:
+            return surface.convert_alpha()
+        return surface.convert()
+
+    def rle(self, surface, category):
+        """ Run-length encodes a colorkeyed surface so blits skip its
+        transparent runs. Only worth it for surfaces that are blitted as they
+        are, since scaling or rotating one has to decode it first. """
+        surface.set_colorkey(surface.get_colorkey(), pygame.RLEACCEL)
+        return self.track(surface, category)
+
+    def track(self, surface, category):
+        if category not in self.surfaces:
+            self.surfaces[category] = weakref.WeakValueDictionary()
+        self.surfaces[category][id(surface)] = surface
+        return surface
+
+    def track_rotations(self, cache):
+        self.rotation_caches.add(cache)
+        return cache
+
+    def track_scales(self, cache):
+        self.scale_caches.add(cache)
+        return cache
+
+    def report(self):
+        """ Bytes of pixel data held by each category """
+        totals = {}
+        for category, surfaces in self.surfaces.items():
+            totals[category] = sum(self.surface_bytes(surface) for surface in list(surfaces.values()))
+        totals["rotations"] = sum(self.surface_bytes(frame) for cache in list(self.rotation_caches)
+                                  for frame in cache.frames if frame is not None)
+        totals["scaled"] = sum(self.surface_bytes(frame) for cache in list(self.scale_caches)
+                               for frame in list(cache.frames.values()))
+        return totals
+
+    @staticmethod
+    def surface_bytes(surface):
+        return surface.get_pitch() * surface.get_height()
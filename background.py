@@ -0,0 +1,36 @@
+import math
+import time
+import pygame
+import constants as c
+
+
+class StripeBackground:
+    """ Diagonal stripes scrolling sideways behind a menu.
+
+    The pattern repeats every spacing pixels both across and down, so it is
+    drawn once into a tile one spacing wider than the screen and a few
+    spacings tall, and each frame blits that tile down the screen shifted
+    by the scroll. """
+
+    def __init__(self, game, size=c.WINDOW_SIZE, speed=20, fill=(20, 20, 20), color=(40, 30, 10),
+                 width=6, spacing=30, tile_height=120):
+        self.size = size
+        self.speed = speed
+        self.spacing = spacing
+        tile_height = spacing * max(math.ceil(tile_height / spacing), 1)
+        self.tile = pygame.Surface((size[0] + spacing, tile_height))
+        self.tile.fill(fill)
+        # Run every stripe off the tile's edges so no line ends show
+        for x in range(0, self.tile.get_width() + tile_height + 2*spacing, spacing):
+            pygame.draw.line(self.tile, color, (x + spacing, tile_height + spacing), (x - tile_height - spacing, -spacing), width)
+        self.tile = game.assets.track(game.assets.convert(self.tile), "menus")
+
+    def draw(self, surface):
+        x = int(time.time() * self.speed % self.spacing) - self.spacing
+        y = self.size[1]
+        height = self.tile.get_height()
+        blits = []
+        while y > 0:
+            y -= height
+            blits.append((self.tile, (x, y)))
+        surface.blits(blits, doreturn=False)
@@ -0,0 +1,227 @@
+""" Plays many headless bot rounds across worker processes, for balancing
+powerups. Each configuration sets the powerup weights, effect durations and
+room, and is reported as win rates, round lengths and how often each
+powerup is picked up and won with, all with 95% confidence intervals.
+
+    python batch.py --matches 2000
+    python batch.py --weights shooting=0 --weights shooting=7 --duration shooting=15 """
+
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import constants as c
+from game import Game, POWERUP_WEIGHTS
+from headless import HeadlessMatch
+from powerup import *
+
+# Short name -> (powerup class, effect id)
+POWERUPS = {"socks": (SlipperySocksPowerup, c.SLIPPERY_SOCKS),
+            "spin": (FastSpinPowerup, c.FAST_SPINNING),
+            "double": (DoubleShotPowerup, c.DOUBLE_SHOT),
+            "bouncy": (BouncyPowerup, c.BOUNCY),
+            "shooting": (FastShootingPowerup, c.FAST_SHOOTING)}
+KIND_NAMES = {kind: name for name, (kind, _) in POWERUPS.items()}
+EFFECT_NAMES = {effect_id: name for name, (_, effect_id) in POWERUPS.items()}
+ROOMS = [1, 2, 3, 4, 5, 6, 7]
+Z = 1.96
+
+# Each worker process builds one Game and plays all its rounds in it
+_game = None
+
+
+def worker_game():
+    global _game
+    if _game is None:
+        _game = Game(headless=True)
+    return _game
+
+
+class Bot:
+    """ Charges for a random time, fires, then waits a random time before
+    charging again """
+
+    def __init__(self, key, rng):
+        self.key = key
+        self.rng = rng
+        self.held = False
+        self.wait = rng.uniform(0, 1)
+
+    def update(self, match):
+        self.wait -= match.dt
+        if self.wait > 0:
+            return
+        if self.held:
+            match.release(self.key)
+            self.wait = self.rng.uniform(0.1, 0.8)
+        else:
+            match.press(self.key)
+            self.wait = self.rng.uniform(0.3, 1.2)
+        self.held = not self.held
+
+
+def parse_settings(text):
+    """ "spin=10,socks=5" -> {"spin": 10.0, "socks": 5.0} """
+    settings = {}
+    for item in filter(None, text.split(",")):
+        name, _, value = item.partition("=")
+        if name not in POWERUPS:
+            raise argparse.ArgumentTypeError(f"unknown powerup {name!r}, expected one of {', '.join(POWERUPS)}")
+        try:
+            settings[name] = float(value)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"{name} needs a number, not {value!r}")
+        if settings[name] < 0:
+            raise argparse.ArgumentTypeError(f"{name} can't be negative")
+    return settings
+
+
+def play_match(config, seed):
+    """ One bot round, as a dict of what happened in it """
+    game = worker_game()
+    rng = random.Random(seed)
+    game.effect_durations = dict(EFFECT_DURATIONS)
+    for name, seconds in config["durations"].items():
+        game.effect_durations[POWERUPS[name][1]] = seconds
+    weights = [(kind, config["weights"].get(KIND_NAMES[kind], default)) for kind, default in POWERUP_WEIGHTS]
+    room_num = config["room"] or rng.choice(ROOMS)
+    match = HeadlessMatch(skins=range(1, config["players"] + 1), room_num=room_num, game=game,
+                          seed=seed, powerup_weights=weights)
+    bots = [Bot(key, random.Random(rng.random())) for key in game.key_list]
+
+    spawned = {name: 0 for name in POWERUPS}
+    pickups = []
+    decided = None
+    while not match.over and match.steps * match.dt < config["max_time"]:
+        for bot in bots:
+            bot.update(match)
+        match.step()
+        for powerup in game.powerups:
+            if not hasattr(powerup, "counted"):
+                powerup.counted = True
+                spawned[KIND_NAMES[type(powerup)]] += 1
+        # Effects age before powerups are collected, so one at age 0 was
+        # picked up this step
+        for slot, player in enumerate(match.players):
+            for effect in player.effects:
+                if effect.age == 0:
+                    pickups.append([slot, EFFECT_NAMES[effect.id]])
+        if decided is None and match.scene.is_over:
+            decided = match.steps * match.dt
+
+    alive = [slot for slot, player in enumerate(match.players) if not player.dead]
+    return {"seed": seed,
+            "room": room_num,
+            "seconds": decided if decided is not None else match.steps * match.dt,
+            "timeout": decided is None,
+            "winner": alive[0] if decided is not None and len(alive) == 1 else None,
+            "spawned": spawned,
+            "pickups": pickups}
+
+
+def play_matches(config, seeds):
+    return [play_match(config, seed) for seed in seeds]
+
+
+def run_batch(config, matches, jobs, seed=0):
+    """ Plays matches rounds of config over jobs processes. Rounds go out in
+    chunks, several per worker, so a slow chunk doesn't leave the others
+    idle at the end and the workers rarely wait on the parent. """
+    seeds = [seed + i for i in range(matches)]
+    size = max(1, math.ceil(matches / (jobs * 8)))
+    chunks = [seeds[i:i + size] for i in range(0, matches, size)]
+    if jobs == 1:
+        return [result for chunk in chunks for result in play_matches(config, chunk)]
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        return [result for chunk in pool.map(play_matches, [config] * len(chunks), chunks) for result in chunk]
+
+
+def wilson(hits, total):
+    """ Proportion with the bounds of its 95% Wilson score interval """
+    if total == 0:
+        return {"rate": None, "low": None, "high": None, "n": 0}
+    p = hits / total
+    center = (p + Z**2 / (2 * total)) / (1 + Z**2 / total)
+    half = Z * math.sqrt(p * (1 - p) / total + Z**2 / (4 * total**2)) / (1 + Z**2 / total)
+    return {"rate": p, "low": center - half, "high": center + half, "n": total}
+
+
+def mean_interval(values):
+    """ Mean with the half width of its 95% normal interval """
+    if not values:
+        return {"mean": None, "error": None, "n": 0}
+    mean = sum(values) / len(values)
+    variance = sum((value - mean)**2 for value in values) / max(len(values) - 1, 1)
+    return {"mean": mean, "error": Z * math.sqrt(variance / len(values)), "n": len(values)}
+
+
+def summarize(config, results):
+    players = config["players"]
+    decided = [result for result in results if not result["timeout"]]
+    won = [result for result in decided if result["winner"] is not None]
+    powerups = {}
+    for name in POWERUPS:
+        spawned = sum(result["spawned"][name] for result in results)
+        picked = sum(name == pick for result in results for _, pick in result["pickups"])
+        # Whether each player who picked this up at least once went on to win
+        holders = [(result, slot) for result in decided
+                   for slot in {slot for slot, pick in result["pickups"] if pick == name}]
+        powerups[name] = {"spawned_per_match": mean_interval([result["spawned"][name] for result in results]),
+                          "picked_up": wilson(picked, spawned),
+                          "win_rate_of_holders": wilson(sum(result["winner"] == slot for result, slot in holders),
+                                                        len(holders))}
+    return {"config": config,
+            "matches": len(results),
+            "timeouts": len(results) - len(decided),
+            "draws": len(decided) - len(won),
+            "win_rate": [wilson(sum(result["winner"] == slot for result in won), len(won)) for slot in range(players)],
+            "seconds": mean_interval([result["seconds"] for result in decided]),
+            "fair_win_rate": 1 / players,
+            "powerups": powerups}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play bot rounds across processes to balance powerups")
+    parser.add_argument("--matches", type=int, default=1000, help="rounds per configuration")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("--players", type=int, default=2, choices=[2, 3, 4])
+    parser.add_argument("--room", type=int, choices=ROOMS, help="room to play in (default: a random one each round)")
+    parser.add_argument("--weights", type=parse_settings, action="append",
+                        help="powerup weights such as spin=10,shooting=7, changing the defaults; "
+                             "each one given is a configuration to compare")
+    parser.add_argument("--duration", type=parse_settings, default={},
+                        help="effect durations in seconds, such as shooting=15")
+    parser.add_argument("--max-time", type=float, default=180, help="simulated seconds before a round is a timeout")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="file to write the JSON results to (default: stdout)")
+    args = parser.parse_args(argv)
+
+    summaries = []
+    for weights in args.weights or [{}]:
+        config = {"weights": weights, "durations": args.duration, "room": args.room,
+                  "players": args.players, "max_time": args.max_time}
+        start = time.perf_counter()
+        results = run_batch(config, args.matches, args.jobs, args.seed)
+        elapsed = time.perf_counter() - start
+        summary = summarize(config, results)
+        summary["wall_seconds"] = elapsed
+        summary["matches_per_second"] = len(results) / elapsed
+        summaries.append(summary)
+        print(f"{weights or 'default weights'}: {summary['matches_per_second']:.1f} matches/s, "
+              f"{summary['timeouts']} of {summary['matches']} timed out", file=sys.stderr)
+
+    report = {"jobs": args.jobs, "seed": args.seed, "configurations": summaries}
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
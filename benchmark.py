@@ -0,0 +1,197 @@
+""" Scripted gameplay benchmarks. Each scenario plays a real RoomScene round
+under the SDL dummy driver, timing simulation steps and rendered frames
+separately, and the results are written as JSON.
+
+    python benchmark.py --out results.json
+    python benchmark.py --scenario bullets --seconds 5 """
+
+import argparse
+import json
+import math
+import platform
+import random
+import subprocess
+import sys
+import time
+
+import pygame
+import constants as c
+from bullet import Bullet
+from game import Game
+from headless import HeadlessMatch
+from powerup import DoubleShot, Bouncy
+
+# name -> (room number, function called with the match before every step,
+# fewest live bullets the run must reach for its load to count)
+SCENARIOS = {}
+
+
+def scenario(name, room_num=3, min_bullets=0):
+    def register(func):
+        SCENARIOS[name] = (room_num, func, min_bullets)
+        return func
+    return register
+
+
+def keep_alive(match):
+    """ Nobody dies from bullets, so the round lasts as long as the benchmark """
+    for player in match.players:
+        player.hp = 10**9
+
+
+def mash_buttons(match, hold=0.8, cycle=1.0):
+    """ Once the controls are enabled, every player charges for hold seconds
+    and fires, every cycle seconds, staggered so they don't all fire on the
+    same step. Each press is always followed by its release. """
+    if not match.scene.checking_inputs:
+        return
+    if not hasattr(match, "held_keys"):
+        match.held_keys = set()
+        match.mash_start = match.steps
+    for i, key in enumerate(match.game.key_list):
+        step = match.steps - match.mash_start - i*7
+        if step < 0:
+            continue
+        step %= int(cycle * c.SIM_FPS)
+        if step == 0 and key not in match.held_keys:
+            match.press(key)
+            match.held_keys.add(key)
+        elif step == int(hold * c.SIM_FPS) and key in match.held_keys:
+            match.release(key)
+            match.held_keys.remove(key)
+
+
+@scenario("powerups", min_bullets=8)
+def powerups(match):
+    """ Four players firing double bouncy shots for the whole run """
+    keep_alive(match)
+    for player in match.players:
+        DoubleShot(player)
+        Bouncy(player)
+    mash_buttons(match)
+
+
+@scenario("bullets", min_bullets=200)
+def bullets(match, count=200):
+    """ Tops the room up to count bouncing bullets every step """
+    keep_alive(match)
+    owner = match.players[0]
+    Bouncy(owner)
+    spawns = match.game.room.powerup_spawns + list(match.game.room.spawns.values())
+    while len(match.game.bullets) < count:
+        angle = random.random() * 2 * math.pi
+        velocity = (math.cos(angle) * 800, math.sin(angle) * 800)
+        match.game.bullets.append(Bullet(match.game, owner, random.choice(spawns), velocity))
+
+
+@scenario("leg_bursts")
+def leg_bursts(match, every=0.125):
+    """ All players die and come back several times a second, each death
+    throwing eight legs """
+    keep_alive(match)
+    mash_buttons(match)
+    if match.steps % max(int(every * c.SIM_FPS), 1) == 0:
+        for player in match.players:
+            player.die()
+            player.dead = False
+
+
+for room_num in range(1, 8):
+    @scenario(f"room_{room_num}", room_num=room_num, min_bullets=2)
+    def plain_round(match):
+        """ An ordinary round with everyone firing """
+        keep_alive(match)
+        mash_buttons(match)
+
+
+def percentile(times, p):
+    times = sorted(times)
+    return times[min(int(p * len(times)), len(times) - 1)] if times else 0
+
+
+def run_scenario(game, name, seconds, seed=0):
+    room_num, on_step, min_bullets = SCENARIOS[name]
+    random.seed(seed)
+    match = HeadlessMatch(skins=(1, 2, 3, 4), room_num=room_num, game=game)
+    # Skip the countdown, which keeps the controls disabled
+    match.scene.countdown = 0.5
+
+    sim_times = []
+    render_times = []
+    peak = {"bullets": 0, "particles": 0, "trails": 0}
+    screen = game.screen
+    for _ in range(int(seconds * c.SIM_FPS)):
+        on_step(match)
+
+        start = time.perf_counter()
+        match.step()
+        sim_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        match.scene.draw(screen, 0.5)
+        pygame.display.flip()
+        render_times.append(time.perf_counter() - start)
+
+        peak["bullets"] = max(peak["bullets"], len(game.bullets))
+        peak["particles"] = max(peak["particles"], len(game.particles))
+        peak["trails"] = max(peak["trails"], len(game.trails))
+        if match.over:
+            break
+
+    return {"room": room_num,
+            "steps": len(sim_times),
+            "sim_steps_per_second": len(sim_times) / sum(sim_times),
+            "sim_ms_p50": percentile(sim_times, 0.5) * 1000,
+            "sim_ms_p95": percentile(sim_times, 0.95) * 1000,
+            "render_frames_per_second": len(render_times) / sum(render_times),
+            "render_ms_p50": percentile(render_times, 0.5) * 1000,
+            "render_ms_p95": percentile(render_times, 0.95) * 1000,
+            "peak_counts": peak,
+            "min_bullets": min_bullets,
+            "load_reached": peak["bullets"] >= min_bullets}
+
+
+def git_version():
+    try:
+        return subprocess.check_output(["git", "describe", "--always", "--dirty"],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark gameplay scenarios headlessly")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="scenario to run, may be repeated (default: all)")
+    parser.add_argument("--seconds", type=float, default=10, help="simulated seconds per scenario")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="file to write the JSON results to (default: stdout)")
+    args = parser.parse_args(argv)
+
+    game = Game(headless=True)
+    results = {}
+    for name in args.scenario or list(SCENARIOS):
+        results[name] = run_scenario(game, name, args.seconds, args.seed)
+        print(f"{name}: {results[name]['sim_steps_per_second']:.0f} steps/s, "
+              f"{results[name]['render_frames_per_second']:.0f} frames/s", file=sys.stderr)
+        if not results[name]["load_reached"]:
+            print(f"{name}: only {results[name]['peak_counts']['bullets']} live bullets, "
+                  f"expected at least {results[name]['min_bullets']}", file=sys.stderr)
+
+    report = {"version": git_version(),
+              "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+              "python": platform.python_version(),
+              "pygame": pygame.version.ver,
+              "seconds": args.seconds,
+              "seed": args.seed,
+              "scenarios": results}
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    return 0 if all(result["load_reached"] for result in results.values()) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
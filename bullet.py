@@ -2,7 +2,7 @@ import pygame
 import constants as c
 import time
 import math
-from particle import BulletHit, TrailBit
+from particle import BulletHit
 from enemy import Enemy
 
 
@@ -12,6 +12,7 @@ class Bullet:
         self.owner = owner
 
         self.x, self.y = pos
+        self.prev_x, self.prev_y = self.x, self.y
         self.velocity = list(velocity)
         self.radius = 12
         self.damage = damage
@@ -21,6 +22,7 @@ class Bullet:
         self.age = 0
 
         self.bounces = 0
+        self.destroyed = False
 
         self.since_spew = 0
 
@@ -34,25 +36,50 @@ class Bullet:
         self._check_tile_collisions(self)
 
     def update(self, dt, events):
+        self.prev_x, self.prev_y = self.x, self.y
         self.since_spew += dt
         while self.since_spew > 0.01:
-            TrailBit(self.game, self.owner, position=(self.x, self.y))
+            self.game.trails.spawn(self.x, self.y)
             self.since_spew -= 0.01
         self.age += dt
+        self.angle += 120 * dt
+
+        room = self.game.room
+        if room is not None and self.owner.has_powerup(c.BOUNCY) and self.bounces <= 2:
+            self.move_bouncing(dt)
+            return
+
         self.x += self.velocity[0]*dt
         self.y += self.velocity[1]*dt
+        if room is not None:
+            # Check every cell along the way, so no step is long enough to
+            # pass through a wall
+            hit = room.first_blocking_cell(self.prev_x, self.prev_y, self.x, self.y)
+            if hit is not None:
+                x, y, t = hit
+                self.x = c.lerp(self.prev_x, self.x, t)
+                self.y = c.lerp(self.prev_y, self.y, t)
+                room.break_if_breakable_at(x, y)
+                self.destroy()
 
-        self.angle += 120 * dt
-
-        if not self.owner.has_powerup(c.BOUNCY) or self.bounces > 2:
-            if self.game.room is not None:
-                x, y = self.game.room.world_to_cell(self.x, self.y, discrete=True)
-                if self.game.room.cell_is_blocking(x, y):
-                    self.game.room.break_if_breakable_at(x, y)
-                    self.destroy()
-        else:
-            if self.game.room is not None:
-                self.check_tile_collisions()
+    def move_bouncing(self, dt):
+        """ Moves at most one radius between tile checks. Tiles push the
+        bullet back out of whichever side it overlaps, which goes wrong once
+        it is far enough in to overlap the tiles beside it. """
+        distance = c.mag(*self.velocity) * dt
+        steps = max(1, math.ceil(distance / self.radius))
+        room = self.game.room
+        if steps > 1 and distance < c.TILE_SIZE - self.radius:
+            # Only tiles next to the current cell are in reach of a move this
+            # short, so with none there it can't hit anything on the way
+            if not room.blocking_neighbors(*room.world_to_cell(self.x, self.y, discrete=True)):
+                steps = 1
+        for _ in range(steps):
+            self.x += self.velocity[0]*dt/steps
+            self.y += self.velocity[1]*dt/steps
+            self.check_tile_collisions()
+            if self.destroyed:
+                break
 
     def destroy(self):
         self.destroyed = True
@@ -61,18 +88,26 @@ class Bullet:
         self.game.current_scene.shake(3)
         self.game.bullet_destroyed_noise.play()
 
-    def draw(self, surface, offset=(0, 0)):
+    def draw(self, surface, offset=(0, 0), alpha=1):
+        px = c.lerp(self.prev_x, self.x, alpha)
+        py = c.lerp(self.prev_y, self.y, alpha)
         surf = pygame.transform.rotate(self.surf, self.angle)
-        x = self.x - surf.get_width()//2 + offset[0]
-        y = self.y - surf.get_height()//2 + offset[1]
+        x = px - surf.get_width()//2 + offset[0]
+        y = py - surf.get_height()//2 + offset[1]
         vis_rad = self.radius + 2 * math.sin(self.age*40)
         #surface.blit(surf, (x, y))
-        pygame.draw.circle(surface, (200, 200, 200), (self.x + offset[0], self.y + offset[1]), vis_rad+2)
-        pygame.draw.circle(surface, (255, 255, 255), (self.x + offset[0], self.y + offset[1]), vis_rad)
-        x = self.x - self.glow.get_width()//2 + offset[0]
-        y = self.y - self.glow.get_height()//2 + offset[1]
+        pygame.draw.circle(surface, (200, 200, 200), (px + offset[0], py + offset[1]), vis_rad+2)
+        pygame.draw.circle(surface, (255, 255, 255), (px + offset[0], py + offset[1]), vis_rad)
+        x = px - self.glow.get_width()//2 + offset[0]
+        y = py - self.glow.get_height()//2 + offset[1]
         surface.blit(self.glow, (x, y), special_flags=pygame.BLEND_RGBA_ADD)
 
+    def dirty_rect(self, alpha=1):
+        px = c.lerp(self.prev_x, self.x, alpha)
+        py = c.lerp(self.prev_y, self.y, alpha)
+        reach = max(max(self.glow.get_size())/2, self.radius + 4)
+        return pygame.Rect(px - reach, py - reach, reach*2, reach*2)
+
     def collide_with(self, other):
         if hasattr(other, "friendly"):
             if self.owner in other.friendly:
@@ -80,4 +115,4 @@ class Bullet:
         self.hit(other)
 
     def hit(self, other):
-        pass
+        other.get_hit_by(self)
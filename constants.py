@@ -29,8 +29,43 @@ def approach(num, dest, amt):
             num = dest
     return num
 
+def lerp(a, b, t):
+    return a + (b - a) * t
 
-MAX_FPS = 64
+def direction_vector(angle):
+    """ Unit vector for an angle in degrees CCW from right, looked up from a
+    table quantized to DIRECTION_STEPS """
+    return _DIRECTIONS[int(round(angle * DIRECTION_STEPS / 360)) % DIRECTION_STEPS]
+
+
+SIM_FPS = 64 # fixed simulation rate
+SIM_DT = 1/SIM_FPS
+MAX_SIM_STEPS = 4 # most steps simulated per rendered frame before slowing down
+MAX_FPS = 144 # render rate cap
+
+ROTATION_STEPS = 360 # pre-rotated copies kept per sprite
+DIRECTION_STEPS = 720
+_DIRECTIONS = [(math.cos(i/DIRECTION_STEPS*2*math.pi), -math.sin(i/DIRECTION_STEPS*2*math.pi))
+               for i in range(DIRECTION_STEPS)]
+
+DIRTY_RECTS = False # redraw and push only the changed parts of the room screen
+DIRTY_RECT_CELL = 32 # grid size, in pixels, that dirty rects snap to
+DIRTY_RECT_MAX_COVERAGE = 0.5 # redraw the whole screen past this fraction
+
+ROOM_CACHE_ON_DISK = False # keep parsed rooms in ROOM_CACHE_DIR between runs
+ROOM_CACHE_DIR = ".room_cache"
+
+TEXT_CACHE_BYTES = 4*1024*1024 # rendered menu text kept between frames
+
+SOUND_CHANNELS = 8 # mixer channels shared by all sound effects
+
+RECORD_REPLAYS = False # save every round to REPLAY_DIR, see replay.py
+REPLAY_DIR = "replays"
+
+NET_PORT = 4747 # UDP port for network play, see network.py
+NET_SNAPSHOT_RATE = 20 # world snapshots sent to each client per second
+NET_CLIENT_BYTES_PER_SECOND = 12000 # most the server sends any one client
+NET_HISTORY = 64 # snapshots kept to send deltas against
 
 TILE_SIZE = 48
 
@@ -0,0 +1,84 @@
+import numpy as np
+import pygame
+import constants as c
+
+
+class DirtyRegion:
+    """ The parts of the screen that need redrawing, kept as a coarse grid of
+    cells so overlapping rects merge for free.
+
+    Rects added this frame are remembered for one more frame, so rects()
+    covers both where things are drawn now and where they were drawn last
+    time, which is the area that still shows them and has to be erased. """
+
+    def __init__(self, size=c.WINDOW_SIZE, cell_size=c.DIRTY_RECT_CELL, padding=2):
+        self.size = size
+        self.cell_size = cell_size
+        self.padding = padding
+        self.cols = -(-size[0]//cell_size)
+        self.rows = -(-size[1]//cell_size)
+        self.current = np.zeros((self.rows, self.cols), dtype=bool)
+        self.previous = np.zeros((self.rows, self.cols), dtype=bool)
+
+    def add_rect(self, rect):
+        cs = self.cell_size
+        x0 = max(int((rect[0] - self.padding)//cs), 0)
+        y0 = max(int((rect[1] - self.padding)//cs), 0)
+        x1 = min(int((rect[0] + rect[2] + self.padding)//cs), self.cols - 1)
+        y1 = min(int((rect[1] + rect[3] + self.padding)//cs), self.rows - 1)
+        if x0 <= x1 and y0 <= y1:
+            self.current[y0:y1 + 1, x0:x1 + 1] = True
+
+    def add_points(self, xs, ys, radius):
+        """ Marks a square of the given half size around every point """
+        xs = np.asarray(xs, dtype=float)
+        ys = np.asarray(ys, dtype=float)
+        if not len(xs):
+            return
+        cs = self.cell_size
+        radius += self.padding
+        x0 = np.floor((xs - radius)/cs).astype(int)
+        y0 = np.floor((ys - radius)/cs).astype(int)
+        x1 = np.floor((xs + radius)/cs).astype(int)
+        y1 = np.floor((ys + radius)/cs).astype(int)
+        span = int(2*radius//cs) + 2
+        for i in range(span):
+            cell_xs = x0 + i
+            in_x = (cell_xs <= x1) & (cell_xs >= 0) & (cell_xs < self.cols)
+            for j in range(span):
+                cell_ys = y0 + j
+                keep = in_x & (cell_ys <= y1) & (cell_ys >= 0) & (cell_ys < self.rows)
+                self.current[cell_ys[keep], cell_xs[keep]] = True
+
+    def coverage(self):
+        """ Fraction of the screen rects() would cover """
+        return np.count_nonzero(self.current | self.previous) / self.current.size
+
+    def rects(self):
+        """ Non-overlapping screen rects covering this frame and the last """
+        cs = self.cell_size
+        screen = pygame.Rect((0, 0), self.size)
+        mask = np.zeros((self.rows, self.cols + 2), dtype=np.int8)
+        mask[:, 1:-1] = self.current | self.previous
+        edges = np.diff(mask, axis=1)
+        rects = []
+        open_runs = {}
+        for row in range(self.rows):
+            starts = np.flatnonzero(edges[row] == 1).tolist()
+            ends = np.flatnonzero(edges[row] == -1).tolist()
+            still_open = {}
+            for run in zip(starts, ends):
+                rect = open_runs.get(run)
+                if rect is not None:
+                    # Same columns as the row above, so grow that rect down
+                    rect.height += cs
+                else:
+                    rect = pygame.Rect(run[0]*cs, row*cs, (run[1] - run[0])*cs, cs)
+                    rects.append(rect)
+                still_open[run] = rect
+            open_runs = still_open
+        return [rect.clip(screen) for rect in rects]
+
+    def next_frame(self):
+        self.previous, self.current = self.current, self.previous
+        self.current[:] = False
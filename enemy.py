@@ -1,6 +1,5 @@
 import math
 import pygame
-import random
 import constants as c
 
 
@@ -8,6 +7,7 @@ class Enemy:
     def __init__(self, game, pos):
         self.game = game
         self.x, self.y = pos
+        self.prev_x, self.prev_y = self.x, self.y
         self.velocity = [0, 0]
         self.hp = 1
         self.difficulty_points = 1
@@ -16,29 +16,24 @@ class Enemy:
         self.friendly = self.game.entities
 
     def update(self, dt, events):
+        self.prev_x, self.prev_y = self.x, self.y
         self.x += self.velocity[0] * dt
         self.y += self.velocity[1] * dt
 
         self.check_tile_collisions()
-        self.check_bullet_collisions()
 
         if self.hp <= 0:
             self.game.entities.remove(self)
 
-    def draw(self, surface, offset=(0, 0)):
-        x = self.x + offset[0]
-        y = self.y + offset[1]
+    def draw(self, surface, offset=(0, 0), alpha=1):
+        x = c.lerp(self.prev_x, self.x, alpha) + offset[0]
+        y = c.lerp(self.prev_y, self.y, alpha) + offset[1]
         pygame.draw.circle(surface, (255, 0, 0), (x, y), self.radius)
 
-    def check_bullet_collisions(self):
-        for bullet in self.game.bullets:
-            if bullet.x < self.x - self.radius - bullet.radius or bullet.x > self.x + self.radius + bullet.radius:
-                continue
-            if bullet.y < self.y - self.radius - bullet.radius or bullet.y > self.y + self.radius + bullet.radius:
-                continue
-            if math.sqrt((bullet.x - self.x)**2 + (bullet.y - self.y)**2) < self.radius + bullet.radius:
-                if self not in bullet.owner.friendly:
-                    self.get_hit_by(bullet)
+    def dirty_rect(self, alpha=1):
+        x = c.lerp(self.prev_x, self.x, alpha)
+        y = c.lerp(self.prev_y, self.y, alpha)
+        return pygame.Rect(x - self.radius, y - self.radius, self.radius*2, self.radius*2)
 
     def get_hit_by(self, bullet):
         self.hp -= bullet.damage
@@ -47,21 +42,16 @@ class Enemy:
         if self.game.room is None:
             return
         else:
-            x, y = self.game.room.world_to_cell(self.x, self.y, discrete=True)
-            do_break = False
-            for cell_x in [x-1, x, x+1]:
-                for cell_y in [y-1, y, y+1]:
-                    if self.game.room.cell_is_blocking(cell_x, cell_y):
-                        real_x, real_y = self.game.room.cell_to_world(cell_x, cell_y)
-                        do_break = self.bump_tile(real_x, real_y)
-                        if do_break and hasattr(self, "bounces"):
-                            self.game.bounce_noise.play()
-                        if do_break:
-                            if self.game.room.break_if_breakable_at(cell_x, cell_y):
-                                self.destroy()
-                    if do_break:
-                        break
+            room = self.game.room
+            x, y = room.world_to_cell(self.x, self.y, discrete=True)
+            for cell_x, cell_y in room.blocking_neighbors(x, y):
+                real_x, real_y = room.cell_to_world(cell_x, cell_y)
+                do_break = self.bump_tile(real_x, real_y)
+                if do_break and hasattr(self, "bounces"):
+                    self.game.bounce_noise.play()
                 if do_break:
+                    if room.break_if_breakable_at(cell_x, cell_y):
+                        self.destroy()
                     break
 
     def bump_tile(self, x, y):
@@ -122,12 +112,12 @@ class BounceEnemy(Enemy):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.speed = 100
-        self.surface = pygame.image.load(c.image_path("fly.png"))
+        self.surface = self.game.get_static(c.image_path("fly.png"), "sprites")
 
     def update(self, dt, events):
         super().update(dt, events)
         if self.velocity == [0, 0]:
-            angle = random.random()*math.pi*2
+            angle = self.game.rng.random()*math.pi*2
             self.velocity[0] = math.sin(angle) * self.speed
             self.velocity[1] = math.cos(angle) * self.speed
         mag = c.mag(*self.velocity)
@@ -135,7 +125,12 @@ class BounceEnemy(Enemy):
             self.velocity[0] *= self.speed/mag
             self.velocity[1] *= self.speed/mag
 
-    def draw(self, surface, offset=(0, 0)):
-        x = self.x + offset[0] - self.surface.get_width()//2
-        y = self.y + offset[1] - self.surface.get_height()//2
+    def draw(self, surface, offset=(0, 0), alpha=1):
+        x = c.lerp(self.prev_x, self.x, alpha) + offset[0] - self.surface.get_width()//2
+        y = c.lerp(self.prev_y, self.y, alpha) + offset[1] - self.surface.get_height()//2
         surface.blit(self.surface, (x, y))
+
+    def dirty_rect(self, alpha=1):
+        x = c.lerp(self.prev_x, self.x, alpha)
+        y = c.lerp(self.prev_y, self.y, alpha)
+        return self.surface.get_rect(center=(x, y))
@@ -6,48 +6,90 @@ from room import *
 from enemy import *
 import math
 import time
+import random
 from button import Button
+from sprite_tools import RotationCache, ScaleCache
+from particle import ParticleSystem, BulletHitSystem, TrailPool
+from spatial import SpatialHash
+from dirty import DirtyRegion
+from assets import AssetManager, IMAGE, SOUND
+from profiler import FrameProfiler, TOGGLE_KEY
+from replay import ReplayRecorder
+from sound import SoundManager
+from text import TextCache
+from background import StripeBackground
 import traceback
+import os
 
 from powerup import *
 
+MASTER_VOLUME = 0.7
+
+# Attribute, file, volume, priority and minimum seconds between plays of
+# every sound effect
+SOUNDS = [("button_noise", "button_raw.wav", 0.4, 3, 0),
+          ("join_noise", "join.wav", 0.6, 3, 0),
+          ("cut_off_noise", "start_game.wav", 0.8, 3, 0),
+          ("leave_noise", "player_leave.wav", 0.35, 3, 0),
+          ("bullet_destroyed_noise", "bullet_destroyed.wav", 0.17, 1, 0.04),
+          ("player_hurt_noise", "player_hurt.wav", 0.5, 3, 0),
+          ("shoot_noise", "shoot_raw.wav", 0.20, 2, 0.03),
+          ("bounce_noise", "bounce.wav", 0.15, 0, 0.05),
+          ("powerup_land_noise", "powerup_land.wav", 0.18, 2, 0),
+          ("powerup_collect_noise", "powerup_collect.wav", 0.32, 2, 0)]
+
+# (powerup class, relative chance) for each powerup that drops in a round
+POWERUP_WEIGHTS = [(SlipperySocksPowerup, 10),
+                   (FastSpinPowerup, 10),
+                   (DoubleShotPowerup, 7),
+                   (BouncyPowerup, 7),
+                   (FastShootingPowerup, 0)]
+
 class Game:
-    def __init__(self):
+    def __init__(self, headless=False):
+        self.started = time.perf_counter()
+        self.startup_times = {}
+        self.headless = headless
+        if headless:
+            os.environ["SDL_VIDEODRIVER"] = "dummy"
+            os.environ["SDL_AUDIODRIVER"] = "dummy"
         pygame.init()
         self.clock = pygame.time.Clock()
         self.screen = pygame.display.set_mode(c.WINDOW_SIZE)
         self.next_scene = None
-        self.bullets = set()
-        self.particles = set()
-        self.top_particles = set()
+        self.assets = AssetManager()
+        self.bullets = []
+        self.bullet_grid = SpatialHash(c.TILE_SIZE)
+        self.particles = ParticleSystem(self)
+        self.top_particles = BulletHitSystem(self)
+        self.trails = TrailPool(self)
         self.powerups = []
         self.entities = []
-        self.static_images = {}
+        self.rotation_caches = {}
+        self.scale_caches = {}
+        self.tile_atlas = None
         self.room = None
-
-        master=0.7
-        self.button_noise = pygame.mixer.Sound(c.sounds_path("button_raw.wav"))
-        self.button_noise.set_volume(0.4*master)
-        self.join_noise = pygame.mixer.Sound(c.sounds_path("join.wav"))
-        self.join_noise.set_volume(0.6*master)
-        self.cut_off_noise = pygame.mixer.Sound(c.sounds_path("start_game.wav"))
-        self.cut_off_noise.set_volume(0.8*master)
-        self.leave_noise = pygame.mixer.Sound(c.sounds_path("player_leave.wav"))
-        self.leave_noise.set_volume(0.35*master)
-        self.bullet_destroyed_noise = pygame.mixer.Sound(c.sounds_path("bullet_destroyed.wav"))
-        self.bullet_destroyed_noise.set_volume(0.17*master)
-        self.player_hurt_noise = pygame.mixer.Sound(c.sounds_path("player_hurt.wav"))
-        self.player_hurt_noise.set_volume(0.5*master)
-        self.shoot_noise = pygame.mixer.Sound(c.sounds_path("shoot_raw.wav"))
-        self.shoot_noise.set_volume(0.20*master)
-        self.bounce_noise = pygame.mixer.Sound(c.sounds_path("bounce.wav"))
-        self.bounce_noise.set_volume(0.15*master)
-        self.powerup_land_noise = pygame.mixer.Sound(c.sounds_path("powerup_land.wav"))
-        self.powerup_land_noise.set_volume(0.18*master)
-        self.powerup_collect_noise = pygame.mixer.Sound(c.sounds_path("powerup_collect.wav"))
-        self.powerup_collect_noise.set_volume(0.32*master)
-        pygame.mixer.music.load(c.sounds_path("music_v1.wav"))
-        pygame.mixer.music.play(-1)
+        self.room_cache = {}
+        self.profiler = FrameProfiler()
+        self.sounds = SoundManager(enabled=not headless)
+        self.text = TextCache(self.assets)
+        # Everything random that the simulation depends on draws from rng,
+        # which each round seeds, so rounds can be replayed
+        self.rng = random.Random()
+        self.effect_durations = dict(EFFECT_DURATIONS)
+
+        self.loaded = False
+        if headless:
+            # Nothing is shown while loading, so load lazily as before
+            self.finish_loading()
+        else:
+            # Read everything in the background while the splash screens play
+            manifest = [(SOUND, c.sounds_path(name), "sounds") for _, name, *_ in SOUNDS]
+            for scene in (CharacterSelect, RoomScene, ResultsScreen):
+                manifest += scene.manifest
+            self.assets.preload(manifest)
+            pygame.mixer.music.load(c.sounds_path("music_v1.ogg"))
+            pygame.mixer.music.play(-1)
 
         pygame.display.set_caption("Spinnerets")
 
@@ -55,52 +97,159 @@ class Game:
         self.skin_list = []
         self.win_list = []
 
-        self.current_scene = LD47Scene(self)#RoomScene(self)
+        self.current_scene = None if headless else LD47Scene(self)#RoomScene(self)
+
+    def load_sound(self, name, volume, priority=1, min_interval=0):
+        sound = None if self.headless else self.assets.sound(c.sounds_path(name))
+        return self.sounds.effect(sound, volume, priority, min_interval)
+
+    def finish_loading(self):
+        """ Makes every preloaded asset resident, waiting for any that are
+        still loading """
+        if self.loaded:
+            return
+        for attr, name, volume, priority, min_interval in SOUNDS:
+            setattr(self, attr, self.load_sound(name, volume*MASTER_VOLUME, priority, min_interval))
+        if not self.headless:
+            self.assets.finish()
+            self.get_tile_atlas()
+        self.loaded = True
 
     def reset_room(self):
         self.powerups = []
         self.entities = []
-        self.bullets = set()
-        self.particles = set()
-        self.top_particles = set()
+        self.bullets = []
+        self.particles.clear()
+        self.top_particles.clear()
+        self.trails.clear()
 
-    def get_static(self, path):
-        if path not in self.static_images:
-            self.static_images[path] = pygame.image.load(path)
-        return self.static_images[path]
+    def get_static(self, path, category="images"):
+        return self.assets.image(path, category)
+
+    def get_tile_atlas(self):
+        if self.tile_atlas is None:
+            self.tile_atlas = TileAtlas(self)
+        return self.tile_atlas
+
+    def get_rotation_cache(self, key, surface):
+        if key not in self.rotation_caches:
+            self.rotation_caches[key] = self.assets.track_rotations(RotationCache(surface, c.ROTATION_STEPS))
+        return self.rotation_caches[key]
+
+    def get_scale_cache(self, key, surface, quantum=1):
+        if key not in self.scale_caches:
+            self.scale_caches[key] = self.assets.track_scales(ScaleCache(surface, quantum))
+        return self.scale_caches[key]
 
     def main(self):
         while True:
+            if not self.current_scene.overlaps_loading:
+                self.finish_loading()
             self.current_scene.main()
             self.current_scene = self.next_scene
             self.clear_scene()
 
     def clear_scene(self):
-        self.bullets = set()
+        self.bullets = []
 
     def update_globals(self):
-        dt = self.clock.tick(c.MAX_FPS)/1000
-        events = pygame.event.get()
-        for event in events:
+        if self.headless:
+            # Step as fast as possible, exactly one simulation step per frame
+            dt = c.SIM_DT
+        else:
+            dt = self.clock.tick(c.MAX_FPS)/1000
+        events = []
+        for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 pygame.quit()
                 sys.exit()
-        if dt > 1/15:
-            dt = 1/15
+            if event.type in (pygame.KEYDOWN, pygame.KEYUP) and event.key == TOGGLE_KEY and event.key not in self.key_list:
+                # Kept from the scene, so character select can't bind it
+                if event.type == pygame.KEYDOWN:
+                    self.profiler.toggle()
+                continue
+            events.append(event)
         return dt, events
 
-    def flip(self):
-        pygame.display.flip()
+    def flip(self, rects=None):
+        if self.headless:
+            return
+        if "interactive" not in self.startup_times:
+            self.record_startup()
+        if rects is None:
+            pygame.display.flip()
+        else:
+            pygame.display.update(rects)
+
+    def record_startup(self):
+        """ Notes how long after launch the first frame was shown, and the
+        first frame with every asset resident """
+        now = time.perf_counter() - self.started
+        self.startup_times.setdefault("first_frame", now)
+        if self.loaded:
+            self.startup_times["interactive"] = now
+            print(f"Time to first frame: {self.startup_times['first_frame']:.3f}s, "
+                  f"time to interactive: {now:.3f}s")
 
 class Scene:
+    # (kind, path, category) of every asset the scene uses, for preloading
+    manifest = []
+    # Whether the scene can run while assets are still loading
+    overlaps_loading = False
+
     def __init__(self, game):
         self.game = game
         self.screen = game.screen
         self.shake_mag = 0
+        self.over = False
 
     def shake(self, amt):
         self.shake_mag = max(self.shake_mag, amt)
 
+    def setup(self):
+        pass
+
+    def update(self, dt, events):
+        """ Advances the scene by one fixed timestep of dt seconds """
+        pass
+
+    def draw(self, surface, alpha=1):
+        """ Renders the scene. alpha is how far the frame falls between the
+        previous simulation step and the current one. Returns the screen
+        rects that changed, or None if the whole screen may have. """
+        pass
+
+    def main(self):
+        self.setup()
+        accumulator = 0
+        pending_events = []
+        profiler = self.game.profiler
+        while not self.over:
+            frame_dt, events = self.game.update_globals()
+            profiler.begin_frame()
+            pending_events += events
+            accumulator += frame_dt
+
+            steps = 0
+            while accumulator >= c.SIM_DT and not self.over:
+                self.update(c.SIM_DT, pending_events)
+                pending_events = []
+                accumulator -= c.SIM_DT
+                steps += 1
+                if steps >= c.MAX_SIM_STEPS:
+                    # Too far behind to catch up, so let the game slow down
+                    accumulator = 0
+
+            self.game.sounds.flush(frame_dt)
+            profiler.mark("sound")
+            rects = None
+            if not self.game.headless:
+                rects = self.draw(self.screen, accumulator/c.SIM_DT)
+            profiler.mark("draw")
+            self.game.flip(rects)
+            profiler.mark("flip")
+            profiler.end_frame()
+
 
 class RoomSelect(Scene):
     def __init__(self, *args, **kwargs):
@@ -108,10 +257,11 @@ class RoomSelect(Scene):
         self.count = 4
         self.room_previews = [self.get_preview(idx) for idx in range(1, 1+self.count)]
         self.names = ["Starter", "Pips", "Clover"]
-        self.level_font = pygame.font.Font(c.fonts_path("yoster.ttf"), 45)
+        self.level_font = self.game.text.font("yoster.ttf", 45)
+        self.background = StripeBackground(self.game, speed=30, fill=(0, 0, 0))
 
     def get_preview(self, idx):
-        room = Room.from_file(self.game, c.rooms_path(f"{idx}.txt"))
+        room = Room.load(self.game, c.rooms_path(f"{idx}.txt"))
         return room.preview()
 
     def draw_names(self, surface, offset=(0, 0)):
@@ -126,27 +276,19 @@ class RoomSelect(Scene):
     def draw_rooms(self, surface, offset=(0, 0)):
         pass
 
-    def main(self):
-        while True:
-            dt, events = self.game.update_globals()
-
-            offset = (0, 0)
+    def draw(self, surface, alpha=1):
+        offset = (0, 0)
 
-            self.screen.fill((0, 0, 0))
-            self.draw_lines(self.screen)
-            self.draw_rooms(self.screen)
-            self.draw_names(self.screen, offset)
-            pygame.display.flip()
-
-    def draw_lines(self, surface, offset=(0, 0)):
-        x = (time.time()*30)%30
-        while x < c.WINDOW_WIDTH + c.WINDOW_HEIGHT:
-            x_end = x - c.WINDOW_HEIGHT
-            pygame.draw.line(surface, (40, 30, 10), (x, c.WINDOW_HEIGHT), (x_end, 0), 6)
-            x += 30
+        self.background.draw(surface)
+        self.draw_rooms(surface)
+        self.draw_names(surface, offset)
 
 
 class CharacterSelect(Scene):
+    manifest = ([(IMAGE, c.image_path(f"spider_{skin}.png"), "images") for skin in range(1, 5)] +
+                [(IMAGE, c.image_path(name), "menus") for name in
+                 ["player_frame.png", "button.png", "button_hover.png", "button_disabled.png", "button_clicked.png"]])
+
 
     def __init__(self, game):
         super().__init__(game)
@@ -155,20 +297,22 @@ class CharacterSelect(Scene):
         self.xs = []
         self.since_click = []
         self.skin_to_spider_surf = {skin: self.game.get_static(c.image_path(f"spider_{skin}.png")) for skin in range(1, 5)}
-        self.key_font = pygame.font.Font(c.fonts_path("yoster.ttf"), 75)
-        self.long_key_font = pygame.font.Font(c.fonts_path("yoster.ttf"), 40)
-        self.note_font = pygame.font.Font(c.fonts_path("yoster.ttf"), 20)
+        self.key_font = self.game.text.font("yoster.ttf", 75)
+        self.long_key_font = self.game.text.font("yoster.ttf", 40)
+        self.note_font = self.game.text.font("yoster.ttf", 20)
+        self.background = StripeBackground(self.game)
         self.spider_shadow = pygame.Surface((64, 64))
         self.spider_shadow.fill((255, 255, 255))
         pygame.draw.circle(self.spider_shadow, (0, 0, 0), (32, 32), 32)
         self.spider_shadow.set_alpha(40)
         self.spider_shadow.set_colorkey((255, 255, 255))
-        self.player_frame = pygame.transform.scale2x(pygame.image.load(c.image_path("player_frame.png")))
+        self.game.assets.rle(self.spider_shadow, "shadows")
+        self.player_frame = pygame.transform.scale2x(self.game.get_static(c.image_path("player_frame.png"), "menus"))
 
-        button_surf = pygame.image.load(c.image_path("button.png"))
-        button_hover = pygame.image.load(c.image_path("button_hover.png"))
-        button_disabled = pygame.image.load(c.image_path("button_disabled.png"))
-        button_clicked = pygame.image.load(c.image_path("button_clicked.png"))
+        button_surf = self.game.get_static(c.image_path("button.png"), "menus")
+        button_hover = self.game.get_static(c.image_path("button_hover.png"), "menus")
+        button_disabled = self.game.get_static(c.image_path("button_disabled.png"), "menus")
+        button_clicked = self.game.get_static(c.image_path("button_clicked.png"), "menus")
 
         self.black = pygame.Surface(c.WINDOW_SIZE)
         self.black.fill((0, 0, 0))
@@ -184,13 +328,6 @@ class CharacterSelect(Scene):
         self.button.disable()
         self.over = False
 
-    def draw_lines(self, surface, offset=(0, 0)):
-        x = (time.time()*20)%30
-        while x < c.WINDOW_WIDTH + c.WINDOW_HEIGHT:
-            x_end = x - c.WINDOW_HEIGHT
-            pygame.draw.line(surface, (40, 30, 10), (x, c.WINDOW_HEIGHT), (x_end, 0), 6)
-            x += 30
-
     def next_scene(self):
         self.game.skin_list = self.skins
         self.game.key_list = self.keys
@@ -268,67 +405,67 @@ class CharacterSelect(Scene):
             surface.blit(line,(x-line.get_width()//2+offset[0],y+90-line.get_height()//2+offset[1]+yoff))
             yoff += 20
 
-    def main(self):
-        while not self.over:
-            dt, events = self.game.update_globals()
-
-            for event in events:
-                if event.type == pygame.KEYDOWN and self.black_target_alpha == 0:
-                    self.pressed(event.key)
-
-            self.screen.fill((20, 20, 20))
-            self.draw_lines(self.screen)
-
-            da = self.black_target_alpha - self.black_alpha
-            if da:
-                da = da/abs(da) * 800 * dt
-            self.black_alpha = c.approach(self.black_alpha, self.black_target_alpha, da)
-            if abs(self.black_alpha) < 2:
-                self.black_alpha = 0
-
-            for idx, item in enumerate(self.since_click):
-                self.since_click[idx] += dt
-
-            for idx, x in enumerate(self.xs):
-                d = idx - x
-                self.xs[idx] = c.approach(x, idx, d*dt*12)
-
-            xoff = math.sin(time.time() * 37) * self.shake_mag
-            yoff = math.sin(time.time() * 40) * self.shake_mag
-            self.shake_mag *= 0.1**dt
-            self.shake_mag = c.approach(self.shake_mag, 0, -20*dt)
-            offset = xoff, yoff
-
-            if len(self.keys) < 2:
-                self.button.disable()
-            else:
-                self.button.enable()
-            self.button.update(dt, events)
-
-            x = c.WINDOW_WIDTH//2 - 750//2
-            y = c.WINDOW_HEIGHT//2
-
-            self.draw_title_line(self.screen, offset=offset)
-            self.button.draw(self.screen, offset[0], offset[1])
-
-            for idx, item in enumerate(self.keys):
-                xoff, yoff = offset
-                xoff += self.xs[idx]*250
-                if self.black_target_alpha == 255:
-                    yoff = offset[1] - ((self.black_alpha/9)**2) + 1.5*self.black_alpha
-                self.draw_player_preview(self.screen, idx, (x, y), offset=(xoff, yoff))
+    def update(self, dt, events):
+        for event in events:
+            if event.type == pygame.KEYDOWN and self.black_target_alpha == 0:
+                self.pressed(event.key)
 
-            self.black.set_alpha(self.black_alpha)
-            if self.black_alpha > 0:
-                self.screen.blit(self.black, (0, 0))
+        da = self.black_target_alpha - self.black_alpha
+        if da:
+            da = da/abs(da) * 800 * dt
+        self.black_alpha = c.approach(self.black_alpha, self.black_target_alpha, da)
+        if abs(self.black_alpha) < 2:
+            self.black_alpha = 0
+
+        for idx, item in enumerate(self.since_click):
+            self.since_click[idx] += dt
+
+        for idx, x in enumerate(self.xs):
+            d = idx - x
+            self.xs[idx] = c.approach(x, idx, d*dt*12)
+
+        self.shake_mag *= 0.1**dt
+        self.shake_mag = c.approach(self.shake_mag, 0, -20*dt)
+
+        if len(self.keys) < 2:
+            self.button.disable()
+        else:
+            self.button.enable()
+        self.button.update(dt, events)
 
-            self.game.flip()
+        if self.black_target_alpha == 255 and self.black_alpha >= 255:
+            self.over=True
+            self.game.next_scene = RoomScene(self.game)
 
-            if self.black_target_alpha == 255 and self.black_alpha >= 255:
-                self.over=True
-                self.game.next_scene = RoomScene(self.game)
+    def draw(self, surface, alpha=1):
+        self.background.draw(surface)
+
+        xoff = math.sin(time.time() * 37) * self.shake_mag
+        yoff = math.sin(time.time() * 40) * self.shake_mag
+        offset = xoff, yoff
+
+        x = c.WINDOW_WIDTH//2 - 750//2
+        y = c.WINDOW_HEIGHT//2
+
+        self.draw_title_line(surface, offset=offset)
+        self.button.draw(surface, offset[0], offset[1])
+
+        for idx, item in enumerate(self.keys):
+            xoff, yoff = offset
+            xoff += self.xs[idx]*250
+            if self.black_target_alpha == 255:
+                yoff = offset[1] - ((self.black_alpha/9)**2) + 1.5*self.black_alpha
+            self.draw_player_preview(surface, idx, (x, y), offset=(xoff, yoff))
+
+        self.black.set_alpha(self.black_alpha)
+        if self.black_alpha > 0:
+            surface.blit(self.black, (0, 0))
 
 class ResultsScreen(Scene):
+    manifest = ([(IMAGE, c.image_path(f"spider_{skin}.png"), "images") for skin in range(1, 5)] +
+                [(IMAGE, c.image_path("player_frame.png"), "menus"),
+                 (IMAGE, c.image_path("crown.png"), "images")])
+
 
     def __init__(self, game):
         super().__init__(game)
@@ -346,27 +483,22 @@ class ResultsScreen(Scene):
 
         self.countdown = 10
 
-        self.key_font = pygame.font.Font(c.fonts_path("yoster.ttf"), 75)
-        self.long_key_font = pygame.font.Font(c.fonts_path("yoster.ttf"), 40)
-        self.note_font = pygame.font.Font(c.fonts_path("yoster.ttf"), 20)
+        self.key_font = self.game.text.font("yoster.ttf", 75)
+        self.long_key_font = self.game.text.font("yoster.ttf", 40)
+        self.note_font = self.game.text.font("yoster.ttf", 20)
+        self.background = StripeBackground(self.game)
         self.spider_shadow = pygame.Surface((64, 64))
         self.spider_shadow.fill((255, 255, 255))
         pygame.draw.circle(self.spider_shadow, (0, 0, 0), (32, 32), 32)
         self.spider_shadow.set_alpha(40)
         self.spider_shadow.set_colorkey((255, 255, 255))
-        self.player_frame = pygame.transform.scale2x(pygame.image.load(c.image_path("player_frame.png")))
+        self.game.assets.rle(self.spider_shadow, "shadows")
+        self.player_frame = pygame.transform.scale2x(self.game.get_static(c.image_path("player_frame.png"), "menus"))
 
         self.since_click = [0 for _ in self.game.key_list]
 
         self.crown = self.game.get_static(c.image_path("crown.png"))
 
-    def draw_lines(self, surface, offset=(0, 0)):
-        x = (time.time()*20)%30
-        while x < c.WINDOW_WIDTH + c.WINDOW_HEIGHT:
-            x_end = x - c.WINDOW_HEIGHT
-            pygame.draw.line(surface, (40, 30, 10), (x, c.WINDOW_HEIGHT), (x_end, 0), 6)
-            x += 30
-
     def next_scene(self):
         #self.over = True
         self.black_target_alpha = 255
@@ -421,70 +553,68 @@ class ResultsScreen(Scene):
         render = self.long_key_font.render(wins_text, 1, (255, 255, 255))
         surface.blit(render, (x - render.get_width()//2+offset[0], y+105-render.get_height()//2+offset[1]))
 
-    def main(self):
-        while not self.over:
-            dt, events = self.game.update_globals()
+    def update(self, dt, events):
+        self.countdown -= dt
 
-            self.countdown -= dt
+        if self.countdown <= 0and self.black_target_alpha <255:
+            self.black_target_alpha = 255
+            self.game.cut_off_noise.play()
 
-            if self.countdown <= 0and self.black_target_alpha <255:
-                self.black_target_alpha = 255
-                self.game.cut_off_noise.play()
+        for event in events:
+            if event.type == pygame.KEYDOWN:
+                if event.key in self.game.key_list:
+                    self.countdown = int(self.countdown)
+                    self.game.button_noise.play()
 
-            for event in events:
-                if event.type == pygame.KEYDOWN:
-                    if event.key in self.game.key_list:
-                        self.countdown = int(self.countdown)
-                        self.game.button_noise.play()
-
-            self.screen.fill((20, 20, 20))
-            self.draw_lines(self.screen)
-
-            da = self.black_target_alpha - self.black_alpha
-            if da:
-                da = da/abs(da) * 800 * dt
-            self.black_alpha = c.approach(self.black_alpha, self.black_target_alpha, da)
-            if abs(self.black_alpha) < 2:
-                self.black_alpha = 0
-
-            for idx, item in enumerate(self.since_click):
-                self.since_click[idx] += dt
-
-            for idx, x in enumerate(self.xs):
-                d = idx - x
-                self.xs[idx] = c.approach(x, idx, d*dt*12)
-
-            xoff = math.sin(time.time() * 37) * self.shake_mag
-            yoff = math.sin(time.time() * 40) * self.shake_mag
-            self.shake_mag *= 0.1**dt
-            self.shake_mag = c.approach(self.shake_mag, 0, -20*dt)
-            offset = xoff, yoff
-            x = c.WINDOW_WIDTH//2 - 750//2
-            y = c.WINDOW_HEIGHT//2
-
-            self.draw_title_line(self.screen, offset=offset)
-
-            for idx, item in enumerate(self.game.key_list):
-                xoff, yoff = offset
-                xoff += idx*250
-                if self.black_target_alpha == 255:
-                    yoff = offset[1] - ((self.black_alpha/9)**2) + 1.5*self.black_alpha
-                self.draw_player_preview(self.screen, idx, (x, y), offset=(xoff, yoff))
+        da = self.black_target_alpha - self.black_alpha
+        if da:
+            da = da/abs(da) * 800 * dt
+        self.black_alpha = c.approach(self.black_alpha, self.black_target_alpha, da)
+        if abs(self.black_alpha) < 2:
+            self.black_alpha = 0
 
-            self.black.set_alpha(self.black_alpha)
-            if self.black_alpha > 0:
-                self.screen.blit(self.black, (0, 0))
+        for idx, item in enumerate(self.since_click):
+            self.since_click[idx] += dt
+
+        for idx, x in enumerate(self.xs):
+            d = idx - x
+            self.xs[idx] = c.approach(x, idx, d*dt*12)
+
+        self.shake_mag *= 0.1**dt
+        self.shake_mag = c.approach(self.shake_mag, 0, -20*dt)
+
+        if self.black_target_alpha == 255 and self.black_alpha >= 255:
+            self.over=True
+            self.game.next_scene = RoomScene(self.game)
+
+    def draw(self, surface, alpha=1):
+        self.background.draw(surface)
+
+        xoff = math.sin(time.time() * 37) * self.shake_mag
+        yoff = math.sin(time.time() * 40) * self.shake_mag
+        offset = xoff, yoff
+        x = c.WINDOW_WIDTH//2 - 750//2
+        y = c.WINDOW_HEIGHT//2
 
-            self.game.flip()
+        self.draw_title_line(surface, offset=offset)
 
-            if self.black_target_alpha == 255 and self.black_alpha >= 255:
-                self.over=True
-                self.game.next_scene = RoomScene(self.game)
+        for idx, item in enumerate(self.game.key_list):
+            xoff, yoff = offset
+            xoff += idx*250
+            if self.black_target_alpha == 255:
+                yoff = offset[1] - ((self.black_alpha/9)**2) + 1.5*self.black_alpha
+            self.draw_player_preview(surface, idx, (x, y), offset=(xoff, yoff))
+
+        self.black.set_alpha(self.black_alpha)
+        if self.black_alpha > 0:
+            surface.blit(self.black, (0, 0))
 
 class StarFishScene(Scene):
+    overlaps_loading = True
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.logo = pygame.image.load(c.image_path("star_fish.png"))
+        self.logo = self.game.get_static(c.image_path("star_fish.png"), "menus")
         self.logo = pygame.transform.scale2x(self.logo)
         self.age = 0
         self.black = pygame.Surface(c.WINDOW_SIZE)
@@ -495,81 +625,103 @@ class StarFishScene(Scene):
     def next_scene(self):
         return CharacterSelect(self.game)
 
-    def main(self):
-        duration = self.duration
-        while True:
-            dt, events = self.game.update_globals()
-            self.age += dt
-            self.screen.fill((0, 0, 0))
-            self.angle += dt*10
-            logo = pygame.transform.rotate(self.logo, self.angle)
-            x = c.WINDOW_WIDTH//2 - logo.get_width()//2
-            y = c.WINDOW_HEIGHT//2 - logo.get_height()//2
-            self.screen.blit(logo, (x, y))
-            fadein = 0.5
-            fadeout = 0.7
-            if self.age < fadein:
-                alpha = 255 - 255*self.age/fadein
-            elif self.age < duration - fadeout:
-                alpha = 0
-            else:
-                start = duration - fadeout
-                alpha = (self.age - start)/fadeout * 255
-            self.black.set_alpha(alpha)
-            self.screen.blit(self.black, (0, 0))
-            pygame.display.flip()
+    def update(self, dt, events):
+        self.age += dt
+        self.angle += dt*10
+        if self.age > self.duration:
+            self.game.next_scene = self.next_scene()
+            self.over = True
 
-            if self.age > duration:
-                self.game.next_scene = self.next_scene()
-                break
+    def draw(self, surface, alpha=1):
+        duration = self.duration
+        surface.fill((0, 0, 0))
+        logo = pygame.transform.rotate(self.logo, self.angle)
+        x = c.WINDOW_WIDTH//2 - logo.get_width()//2
+        y = c.WINDOW_HEIGHT//2 - logo.get_height()//2
+        surface.blit(logo, (x, y))
+        fadein = 0.5
+        fadeout = 0.7
+        if self.age < fadein:
+            black_alpha = 255 - 255*self.age/fadein
+        elif self.age < duration - fadeout:
+            black_alpha = 0
+        else:
+            start = duration - fadeout
+            black_alpha = (self.age - start)/fadeout * 255
+        self.black.set_alpha(black_alpha)
+        surface.blit(self.black, (0, 0))
 
 class LD47Scene(StarFishScene):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.logo = pygame.image.load(c.image_path("ld47.png"))
+        self.logo = self.game.get_static(c.image_path("ld47.png"), "menus")
 
     def next_scene(self):
         return StarFishScene(self.game)
 
 class RoomScene(Scene):
+    manifest = ([(IMAGE, c.image_path(name), "sprites") for skin in range(1, 5) for name in
+                 [f"player_{skin}.png", f"player_{skin}_dead.png", f"legs_1_{skin}.png", f"legs_2_{skin}.png"]] +
+                [(IMAGE, c.image_path(name), "sprites") for name in ["arrow.png", "fly.png"]] +
+                [(IMAGE, c.image_path(name), "tiles") for name in BORDER_IMAGES + ["grass.png", "breakable.png"]] +
+                [(IMAGE, c.image_path(name), "images") for name in
+                 ["1.png", "2.png", "3.png", "bullet.png", "glow.png",
+                  "spin.png", "socks.png", "double.png", "bouncy.png", "mandible.png",
+                  "spin_icon.png", "socks_icon.png", "double_icon.png", "bouncy_icon.png", "mandible_icon.png"]])
 
-    def __init__(self, *args, **kwargs):
+
+    def __init__(self, *args, room_num=None, seed=None, powerup_weights=None, **kwargs):
         super().__init__(*args, **kwargs)
         self.skin_list = self.game.skin_list
         self.key_list = self.game.key_list
-        self.room_num = random.choice([1, 2, 3, 4, 5, 6, 7])
+        if room_num is None:
+            room_num = random.choice([1, 2, 3, 4, 5, 6, 7])
+        self.room_num = room_num
+        if seed is None:
+            seed = random.getrandbits(32)
+        self.seed = seed
+        self.powerup_weights = POWERUP_WEIGHTS if powerup_weights is None else powerup_weights
         self.checking_inputs = False
         self.countdown = 3
-        self.numbers = [self.game.get_static(c.image_path("1.png")),
-                        self.game.get_static(c.image_path("2.png")),
-                        self.game.get_static(c.image_path("3.png"))]
+        self.numbers = [self.game.get_scale_cache(f"countdown {n}", self.game.get_static(c.image_path(f"{n}.png")), quantum=4)
+                        for n in (1, 2, 3)]
 
     def update_powerup_spawning(self, dt, events):
         self.next_powerup -= dt
         if self.next_powerup <= 0:
             self.random_powerup()
-            self.next_powerup = random.random()*20 + 20
+            self.next_powerup = self.game.rng.random()*20 + 20
 
     def random_powerup(self):
-        weights = [(SlipperySocksPowerup, 10),
-                    (FastSpinPowerup, 10),
-                    (DoubleShotPowerup, 7),
-                    (BouncyPowerup, 7)]
+        weights = self.powerup_weights
         total = sum([i[1] for i in weights])
-        choose = int(random.random() * total)
-        pos = random.choice(self.game.room.powerup_spawns)
+        # Kept as a float so fractional weights get their share. For whole
+        # weights it picks the same powerup as flooring it would
+        choose = self.game.rng.random() * total
+        pos = self.game.rng.choice(self.game.room.powerup_spawns)
         if pos in [(item.x, item.y) for item in self.game.powerups]:
             return
         on = 0
         for item in weights:
             on += item[1]
-            if on > choose:
+            if choose < on:
                 self.game.powerups.append(item[0](self.game, pos=pos))
                 break
 
-    def main(self):
+    def check_bullet_collisions(self):
+        """ Finds every bullet touching a living player or enemy in one pass
+        over a spatial hash of this step's bullets """
+        grid = self.game.bullet_grid
+        grid.rebuild(self.game.bullets)
+        targets = [player for player in self.players if not player.dead] + self.game.entities
+        for target, bullet in grid.contacts(targets):
+            if not bullet.destroyed:
+                bullet.collide_with(target)
+
+    def setup(self):
+        self.game.rng.seed(self.seed)
         self.game.reset_room()
-        self.room = Room.from_file(self.game, c.rooms_path(f"{self.room_num}.txt"))
+        self.room = Room.load(self.game, c.rooms_path(f"{self.room_num}.txt"))
         self.game.room = self.room
         self.next_powerup = 10
         self.players = []
@@ -585,119 +737,189 @@ class RoomScene(Scene):
 
         #self.game.powerups.append(BouncyPowerup(self.game, pos=(500,300)))
         #self.players[0].die()
-        is_over = False
+        self.is_over = False
         self.age = 0
+        self.dirty = DirtyRegion() if c.DIRTY_RECTS else None
+        self.room.track_changes = self.dirty is not None
+        self.last_frame_clean = False
+        self.recorder = ReplayRecorder(self, ReplayRecorder.default_path()) if c.RECORD_REPLAYS else None
 
-        while True:
-            dt, events = self.game.update_globals()
-            self.age += dt
-
-            if not self.checking_inputs:
-                for player in self.players:
-                    player.controller.disabled = True
-            else:
-                for player in self.players:
-                    if not player.dead:
-                        player.controller.disabled = False
-
-            alive_count = sum([not player.dead for player in self.players])
-            if alive_count <= 1 and not is_over:
-                is_over = True
-            if is_over:
-                self.black_target_alpha = 255
-
-            ba = self.black_target_alpha - self.black_alpha
-            if ba < 0:
-                self.black_alpha -= dt*1200
-            elif ba > 0:
-                self.black_alpha += dt * 200
-            if self.black_alpha > 255:
-                self.black_alpha = 255
-            if self.black_alpha <0:
-                self.black_alpha = 0
-
-
-            if self.countdown <= 100:
-                self.countdown -= dt
-                if self.countdown <= 0.5:
-                    self.checking_inputs = True
-
-            self.update_powerup_spawning(dt, events)
-
-            self.room.update(dt, events)
-            for particle in list(self.game.particles):
-                particle.update(dt, events)
-            for bullet in list(self.game.bullets):
-                bullet.update(dt, events)
-            for entity in self.game.entities[::-1]:
-                entity.update(dt, events)
-            for player in self.players[::-1]:
-                player.update(dt, events)
-            for powerup in self.game.powerups[::-1]:
-                powerup.update(dt, events)
-
-            xoff = math.sin(time.time() * 37) * self.shake_mag
-            yoff = math.sin(time.time() * 40) * self.shake_mag
-            self.shake_mag *= 0.1**dt
-            self.shake_mag = c.approach(self.shake_mag, 0, -20*dt)
-            offset = xoff, yoff
-
-            self.screen.fill((0, 0, 0))
-            #if self.player.charging:
-            #    self.screen.fill((200, 200, 200))
-            self.room.draw(self.screen, offset, layer=0)
-            for particle in self.game.particles - self.game.top_particles:
-                particle.draw(self.screen, offset)
-            for entity in self.game.entities:
-                entity.draw(self.screen, offset)
-            self.players.sort(key=lambda x:x.y)
-            for player in self.players:
-                player.draw(self.screen, offset)
-            for powerup in self.game.powerups:
-                if powerup.landed:
-                    powerup.draw(self.screen, offset)
-            self.room.draw(self.screen, offset, layer=2)
-            for powerup in self.game.powerups:
-                if not powerup.landed:
-                    powerup.draw(self.screen, offset)
-            for bullet in self.game.bullets:
-                bullet.draw(self.screen, offset)
-            for particle in self.game.top_particles:
-                particle.draw(self.screen, offset)
+    def update(self, dt, events):
+        self.age += dt
 
+        if not self.checking_inputs:
+            for player in self.players:
+                player.controller.disabled = True
+        else:
+            for player in self.players:
+                if not player.dead:
+                    player.controller.disabled = False
+
+        alive_count = sum([not player.dead for player in self.players])
+        if alive_count <= 1 and not self.is_over:
+            self.is_over = True
+        if self.is_over:
+            self.black_target_alpha = 255
+
+        ba = self.black_target_alpha - self.black_alpha
+        if ba < 0:
+            self.black_alpha -= dt*1200
+        elif ba > 0:
+            self.black_alpha += dt * 200
+        if self.black_alpha > 255:
+            self.black_alpha = 255
+        if self.black_alpha <0:
+            self.black_alpha = 0
+
+
+        if self.countdown <= 100:
+            self.countdown -= dt
+            if self.countdown <= 0.5:
+                self.checking_inputs = True
+
+        self.update_powerup_spawning(dt, events)
+
+        profiler = self.game.profiler
+        profiler.mark("scene")
+        self.room.update(dt, events)
+        profiler.mark("room")
+        self.game.trails.update(dt, events)
+        self.game.particles.update(dt, events)
+        self.game.top_particles.update(dt, events)
+        profiler.mark("particles")
+        for bullet in list(self.game.bullets):
+            bullet.update(dt, events)
+        profiler.mark("bullets")
+        self.check_bullet_collisions()
+        profiler.mark("collisions")
+        for entity in self.game.entities[::-1]:
+            entity.update(dt, events)
+        for player in self.players[::-1]:
+            player.update(dt, events)
+        profiler.mark("players")
+        for powerup in self.game.powerups[::-1]:
+            powerup.update(dt, events)
+        profiler.mark("powerups")
+
+        self.shake_mag *= 0.1**dt
+        self.shake_mag = c.approach(self.shake_mag, 0, -20*dt)
+
+        if self.recorder is not None:
+            self.recorder.record(dt, events)
+
+        if self.is_over and self.black_alpha >= 255:
+            self.over = True
+            self.record_winners()
+            if self.recorder is not None:
+                self.recorder.finish()
+            self.game.next_scene = ResultsScreen(self.game)
+
+    def mark_dirty(self, alpha):
+        """ Adds everything that moves or animates this frame to self.dirty """
+        dirty = self.dirty
+        for rect in self.room.changed_rects:
+            dirty.add_rect(rect)
+        self.room.changed_rects = []
+        self.game.trails.mark_dirty(dirty)
+        self.game.particles.mark_dirty(dirty, alpha)
+        self.game.top_particles.mark_dirty(dirty, alpha)
+        for item in self.game.entities + self.players + self.game.powerups + self.game.bullets:
+            dirty.add_rect(item.dirty_rect(alpha))
+
+    def needs_full_redraw(self):
+        """ Shake moves the whole screen, and the fade, countdown and profiler
+        overlay cover it """
+        return (self.shake_mag > 0 or self.black_alpha > 0 or self.countdown > 0
+                or self.game.profiler.enabled)
+
+    def draw(self, surface, alpha=1):
+        xoff = math.sin(time.time() * 37) * self.shake_mag
+        yoff = math.sin(time.time() * 40) * self.shake_mag
+        offset = xoff, yoff
+        profiler = self.game.profiler
+
+        rects = None
+        if self.dirty is not None:
+            self.mark_dirty(alpha)
+            # Shake, fade and countdown leave marks all over the screen, so the
+            # frame after them has to be drawn in full as well
+            clean = not self.needs_full_redraw()
+            if clean and self.last_frame_clean and self.dirty.coverage() <= c.DIRTY_RECT_MAX_COVERAGE:
+                rects = self.dirty.rects()
+            self.last_frame_clean = clean
+            self.dirty.next_frame()
+
+        if rects is None:
+            surface.fill((0, 0, 0))
+            self.room.draw(surface, offset, layer=0)
+        else:
+            # Everything drawn below lies inside rects, so restoring the room
+            # there erases last frame's sprites without touching the rest
+            for rect in rects:
+                surface.fill((0, 0, 0), rect)
+                self.room.draw(surface, offset, layer=0, area=rect)
+        profiler.mark("draw room")
+        #if self.player.charging:
+        #    surface.fill((200, 200, 200))
+        self.game.trails.draw(surface, offset)
+        self.game.particles.draw(surface, offset, alpha)
+        profiler.mark("draw particles")
+        for entity in self.game.entities:
+            entity.draw(surface, offset, alpha)
+        for player in sorted(self.players, key=lambda x:x.y):
+            player.draw(surface, offset, alpha)
+        for powerup in self.game.powerups:
+            if powerup.landed:
+                powerup.draw(surface, offset, alpha)
+        if rects is None:
+            self.room.draw(surface, offset, layer=2)
+        else:
+            for rect in rects:
+                self.room.draw(surface, offset, layer=2, area=rect)
+        for powerup in self.game.powerups:
+            if not powerup.landed:
+                powerup.draw(surface, offset, alpha)
+        profiler.mark("draw sprites")
+        for bullet in self.game.bullets:
+            bullet.draw(surface, offset, alpha)
+        self.game.top_particles.draw(surface, offset, alpha)
+        profiler.mark("draw bullets")
+
+        number = None
+        if self.countdown >= 2:
+            number = 3
+        elif self.countdown >= 1:
+            number = 2
+        elif self.countdown > 0:
+            number = 1
+        if self.countdown >10:
             number = None
-            if self.countdown >= 2:
-                number = 3
-            elif self.countdown >= 1:
-                number = 2
-            elif self.countdown > 0:
-                number = 1
-            if self.countdown >10:
-                number = None
-            if number:
-                number_surf = self.numbers[number-1]
-                scale = min(1+0.15*math.sin(self.age*math.pi*2), self.countdown*2)
-                number_surf = pygame.transform.scale(number_surf, (int(number_surf.get_width()*scale), int(number_surf.get_height()*scale)))
-                x = c.WINDOW_WIDTH//2 - number_surf.get_width()//2
-                y = c.WINDOW_HEIGHT//2 - number_surf.get_height()//2
-                number_surf.set_colorkey((255, 0, 0))
-                alpha =None
-                number_surf.set_alpha(min(254, self.countdown*500 - 40))
-                self.screen.blit(number_surf, (x, y))
-
-            if self.black_alpha > 0:
-                self.black.set_alpha(self.black_alpha)
-                self.screen.blit(self.black, (0, 0))
-
-            self.game.flip()
-
-            if is_over and self.black_alpha >= 255:
-                for idx, player in enumerate(self.players):
-                    if not player.dead:
-                        actual_idx = self.game.skin_list.index(player.skin)
-                        self.game.win_list[actual_idx] += 1
-                self.game.next_scene = ResultsScreen(self.game)
-                break
+        if number:
+            sizes = self.numbers[number-1]
+            scale = min(1+0.15*math.sin(self.age*math.pi*2), self.countdown*2)
+            number_surf = sizes.get((int(sizes.surface.get_width()*scale), int(sizes.surface.get_height()*scale)))
+            x = c.WINDOW_WIDTH//2 - number_surf.get_width()//2
+            y = c.WINDOW_HEIGHT//2 - number_surf.get_height()//2
+            number_surf.set_colorkey((255, 0, 0))
+            alpha =None
+            number_surf.set_alpha(min(254, self.countdown*500 - 40))
+            surface.blit(number_surf, (x, y))
+
+        if self.black_alpha > 0:
+            self.black.set_alpha(self.black_alpha)
+            surface.blit(self.black, (0, 0))
+
+        profiler.draw(surface, {"bullets": len(self.game.bullets),
+                                "particles": len(self.game.particles),
+                                "top particles": len(self.game.top_particles),
+                                "entities": len(self.game.entities)})
+        return rects
+
+    def record_winners(self):
+        for idx, player in enumerate(self.players):
+            if not player.dead:
+                actual_idx = self.game.skin_list.index(player.skin)
+                self.game.win_list[actual_idx] += 1
 
 
 if __name__ == '__main__':
@@ -0,0 +1,70 @@
+import pygame
+import constants as c
+from game import Game, RoomScene
+from replay import ReplayRecorder
+
+
+class HeadlessMatch:
+    """ Runs a single RoomScene round without a window, audio, or a real-time
+    clock, so it can be stepped as fast as the CPU allows. """
+
+    def __init__(self, skins=(1, 2), keys=None, room_num=None, dt=c.SIM_DT, game=None,
+                 seed=None, record=False, powerup_weights=None):
+        self.game = game if game is not None else Game(headless=True)
+        if keys is None:
+            keys = [pygame.K_a + i for i in range(len(skins))]
+        self.game.skin_list = list(skins)
+        self.game.key_list = list(keys)
+        if len(self.game.win_list) != len(skins):
+            self.game.win_list = [0 for _ in skins]
+
+        self.scene = RoomScene(self.game, room_num=room_num, seed=seed, powerup_weights=powerup_weights)
+        self.game.current_scene = self.scene
+        self.scene.setup()
+        if record:
+            self.scene.recorder = ReplayRecorder(self.scene)
+
+        self.dt = dt
+        self.steps = 0
+        self.over = False
+        self.pending_events = []
+
+    @property
+    def players(self):
+        return self.scene.players
+
+    def press(self, key):
+        self.pending_events.append(pygame.event.Event(pygame.KEYDOWN, key=key))
+
+    def release(self, key):
+        self.pending_events.append(pygame.event.Event(pygame.KEYUP, key=key))
+
+    def step(self, events=None):
+        """ Advances the round by one timestep. Returns True once the round
+        is over. """
+        if self.over:
+            return True
+        if events is None:
+            events = self.pending_events
+            self.pending_events = []
+        profiler = self.game.profiler
+        profiler.begin_frame()
+        self.scene.update(self.dt, events)
+        profiler.end_frame()
+        self.steps += 1
+        self.over = self.scene.over
+        return self.over
+
+    def run(self, max_time=None, on_step=None):
+        """ Steps until the round ends or max_time simulated seconds pass.
+        on_step, if given, is called with this match before every step. """
+        while not self.over:
+            if max_time is not None and self.steps * self.dt >= max_time:
+                break
+            if on_step is not None:
+                on_step(self)
+            self.step()
+        return self.winners()
+
+    def winners(self):
+        return [player.skin for player in self.players if not player.dead]
@@ -0,0 +1,649 @@
+""" Network play over UDP. A headless server runs the round and is the only
+one simulating it; each client sends just its button presses and releases,
+and draws the world from the snapshots the server sends back.
+
+Snapshots are sent as deltas against the last snapshot the client
+acknowledged, and each client has a byte budget per second. Inputs are
+numbered and resent until the server acknowledges them.
+
+    python network.py server --players 2
+    python network.py client --host 127.0.0.1 --skin 2
+    python network.py loopback --players 4 --seconds 30 """
+
+import argparse
+import itertools
+import json
+import random
+import socket
+import sys
+import time
+import zlib
+
+import pygame
+import constants as c
+from bullet import Bullet
+from game import Game, RoomScene
+from headless import HeadlessMatch
+from powerup import *
+
+# Index of each powerup class in a snapshot
+POWERUP_KINDS = [SlipperySocksPowerup, FastSpinPowerup, DoubleShotPowerup, BouncyPowerup, FastShootingPowerup]
+# Effect class of each powerup id
+EFFECTS = {c.FAST_SPINNING: FastSpin,
+           c.SLIPPERY_SOCKS: SlipperySocks,
+           c.DOUBLE_SHOT: DoubleShot,
+           c.BOUNCY: Bouncy,
+           c.FAST_SHOOTING: FastShooting}
+
+# Positions are sent in eighths of a pixel, angles in tenths of a degree
+POSITION_SCALE = 8
+ANGLE_SCALE = 10
+# Largest a message may decompress to
+MAX_MESSAGE = 65536
+
+_net_ids = itertools.count()
+
+
+def net_id(item):
+    """ A number naming an object for as long as it exists """
+    if not hasattr(item, "net_id"):
+        item.net_id = next(_net_ids)
+    return item.net_id
+
+
+def encode(message):
+    return zlib.compress(json.dumps(message, separators=(",", ":")).encode())
+
+
+def decode(packet):
+    """ The message in a packet. Raises ValueError unless it inflates to a
+    JSON object of at most MAX_MESSAGE bytes with a string kind. """
+    inflater = zlib.decompressobj()
+    data = inflater.decompress(packet, MAX_MESSAGE)
+    if not inflater.eof or inflater.unconsumed_tail or inflater.unused_data:
+        raise ValueError("message too long or not a single zlib stream")
+    message = json.loads(data)
+    if not isinstance(message, dict) or not isinstance(message.get("k"), str):
+        raise ValueError("not a message")
+    return message
+
+
+def is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def valid_inputs(message):
+    """ Whether an input message has an int ack and [seq, down] pairs """
+    inputs = message.get("i")
+    return (is_int(message.get("a")) and isinstance(inputs, list) and
+            all(isinstance(item, list) and len(item) == 2 and is_int(item[0]) for item in inputs))
+
+
+def world_state(scene):
+    """ Everything a client needs to draw the round, as lists of ints keyed
+    by entity: p for players, b for bullets, u for powerups, t for the broken
+    tiles and s for the scene """
+    game = scene.game
+    room = scene.room
+    q = lambda value: round(value * POSITION_SCALE)
+    state = {"s": [round(max(scene.countdown, 0) * 100), int(scene.over), round(scene.black_alpha)]}
+    for i, player in enumerate(scene.players):
+        ages = [-1 for _ in EFFECTS]
+        for effect in player.effects:
+            ages[effect.id - 1] = int(effect.age * 10)
+        state[f"p{i}"] = [q(player.x), q(player.y), round(player.angle * ANGLE_SCALE), round(player.hp),
+                          int(player.dead), round(player.charged * 100), int(bool(player.charging)),
+                          int(player.blinking())] + ages
+    for bullet in game.bullets:
+        state[f"b{net_id(bullet)}"] = [q(bullet.x), q(bullet.y)]
+    for powerup in game.powerups:
+        state[f"u{net_id(powerup)}"] = [POWERUP_KINDS.index(type(powerup)), round(powerup.x), round(powerup.y),
+                                        q(powerup.y_offset), int(powerup.landed)]
+    state["t"] = sorted(tile.y_coord * room.width + tile.x_coord for tile in room.breakables if tile.broken)
+    return state
+
+
+def diff(base, state):
+    """ The changes from base to state: new or resized entries in full,
+    changed ones as flat [index, value, ...] pairs, and removed keys """
+    new = {}
+    changed = {}
+    for key, values in state.items():
+        old = base.get(key)
+        if old is None or len(old) != len(values):
+            new[key] = values
+        elif old != values:
+            pairs = []
+            for idx, (before, after) in enumerate(zip(old, values)):
+                if before != after:
+                    pairs += [idx, after]
+            changed[key] = pairs
+    removed = [key for key in base if key not in state]
+    return {"n": new, "c": changed, "r": removed}
+
+
+def patch(base, delta):
+    state = dict(base)
+    for key in delta["r"]:
+        state.pop(key, None)
+    for key, pairs in delta["c"].items():
+        values = list(state[key])
+        for idx in range(0, len(pairs), 2):
+            values[pairs[idx]] = pairs[idx + 1]
+        state[key] = values
+    state.update(delta["n"])
+    return state
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(int(p * len(values)), len(values) - 1)] if values else 0
+
+
+class RemoteClient:
+    def __init__(self, addr, slot, skin, budget):
+        self.addr = addr
+        self.slot = slot
+        self.skin = skin
+        self.input_seq = 0
+        self.ack = -1
+        self.budget = budget
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.skipped = 0
+
+
+class NetServer:
+    """ Runs one round for a fixed number of players once they have all
+    joined, sending each of them a snapshot snapshot_rate times a second """
+
+    def __init__(self, players=2, host="127.0.0.1", port=c.NET_PORT, room_num=None, seed=None,
+                 snapshot_rate=c.NET_SNAPSHOT_RATE, bytes_per_second=c.NET_CLIENT_BYTES_PER_SECOND, game=None):
+        self.players = players
+        self.room_num = room_num
+        self.seed = seed
+        self.snapshot_interval = 1 / snapshot_rate
+        self.bytes_per_second = bytes_per_second
+        self.game = game
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((host, port))
+        self.sock.setblocking(False)
+        self.port = self.sock.getsockname()[1]
+
+        self.clients = {}
+        self.match = None
+        self.tick = 0
+        self.since_snapshot = 0
+        self.since_over = 0
+        self.history = {}
+        self.step_times = []
+        self.snapshot_times = []
+        self.snapshot_sizes = []
+
+    @property
+    def finished(self):
+        # Keep sending for a moment after the round so the clients see it end
+        return self.match is not None and self.match.over and self.since_over > 1
+
+    def poll(self):
+        while True:
+            try:
+                packet, addr = self.sock.recvfrom(65536)
+            except (BlockingIOError, ConnectionResetError):
+                return
+            try:
+                message = decode(packet)
+            except (zlib.error, ValueError):
+                # Anyone can send to the server, so bad packets are dropped
+                continue
+            if addr in self.clients:
+                self.clients[addr].bytes_received += len(packet)
+            self.handle(message, addr)
+
+    def handle(self, message, addr):
+        kind = message.get("k")
+        if kind == "join":
+            if addr not in self.clients and self.match is None and len(self.clients) < self.players:
+                taken = [client.skin for client in self.clients.values()]
+                skin = message.get("skin", 1)
+                if not is_int(skin) or skin in taken or skin not in range(1, 5):
+                    skin = min(set(range(1, 5)) - set(taken))
+                self.clients[addr] = RemoteClient(addr, len(self.clients), skin, self.bytes_per_second / 2)
+                if len(self.clients) == self.players:
+                    self.start()
+            if self.match is None:
+                self.send(addr, {"k": "wait", "joined": len(self.clients), "players": self.players})
+            elif addr in self.clients:
+                self.send(addr, self.welcome(self.clients[addr]))
+        elif kind == "in" and addr in self.clients and self.match is not None and valid_inputs(message):
+            client = self.clients[addr]
+            key = self.match.game.key_list[client.slot]
+            for seq, down in message["i"]:
+                if seq > client.input_seq:
+                    client.input_seq = seq
+                    if down:
+                        self.match.press(key)
+                    else:
+                        self.match.release(key)
+            client.ack = max(client.ack, message["a"])
+
+    def start(self):
+        clients = sorted(self.clients.values(), key=lambda client: client.slot)
+        self.match = HeadlessMatch(skins=[client.skin for client in clients], room_num=self.room_num,
+                                   game=self.game, seed=self.seed)
+
+    def welcome(self, client):
+        return {"k": "welcome", "slot": client.slot, "skins": self.match.game.skin_list,
+                "room": self.match.scene.room_num}
+
+    def send(self, addr, message):
+        packet = encode(message)
+        self.sock.sendto(packet, addr)
+        return len(packet)
+
+    def step(self):
+        """ Simulates one step, and sends snapshots when they are due """
+        if self.match is None:
+            return
+        start = time.perf_counter()
+        self.match.step()
+        self.tick += 1
+        self.step_times.append(time.perf_counter() - start)
+        if self.match.over:
+            self.since_over += c.SIM_DT
+
+        for client in self.clients.values():
+            client.budget = min(client.budget + self.bytes_per_second * c.SIM_DT, self.bytes_per_second / 2)
+        self.since_snapshot += c.SIM_DT
+        if self.since_snapshot >= self.snapshot_interval:
+            self.since_snapshot -= self.snapshot_interval
+            start = time.perf_counter()
+            self.send_snapshots()
+            self.snapshot_times.append(time.perf_counter() - start)
+
+    def send_snapshots(self):
+        state = world_state(self.match.scene)
+        self.history[self.tick] = state
+        oldest = self.tick - c.NET_HISTORY * self.snapshot_interval * c.SIM_FPS
+        for tick in [tick for tick in self.history if tick < oldest]:
+            del self.history[tick]
+
+        for client in self.clients.values():
+            if client.budget <= 0:
+                # Over budget, so this one is skipped and the next delta
+                # covers both
+                client.skipped += 1
+                continue
+            base = client.ack if client.ack in self.history else -1
+            delta = diff(self.history.get(base, {}), state)
+            size = self.send(client.addr, {"k": "snap", "t": self.tick, "b": base,
+                                           "a": client.input_seq, "d": delta})
+            client.budget -= size
+            client.bytes_sent += size
+            self.snapshot_sizes.append(size)
+
+    def run(self):
+        """ Serves in real time until the round is over """
+        next_step = time.perf_counter()
+        while not self.finished:
+            self.poll()
+            now = time.perf_counter()
+            if self.match is None or now < next_step:
+                time.sleep(0.001)
+                if self.match is None:
+                    next_step = now
+                continue
+            self.step()
+            next_step = max(next_step + c.SIM_DT, now - 0.25)
+        return self.report()
+
+    def report(self):
+        seconds = max(self.tick * c.SIM_DT, c.SIM_DT)
+        return {"seconds": seconds,
+                "tick_ms_p50": percentile(self.step_times, 0.5) * 1000,
+                "tick_ms_p95": percentile(self.step_times, 0.95) * 1000,
+                "tick_ms_max": max(self.step_times, default=0) * 1000,
+                "snapshot_ms_p50": percentile(self.snapshot_times, 0.5) * 1000,
+                "snapshot_ms_p95": percentile(self.snapshot_times, 0.95) * 1000,
+                "snapshot_bytes_p50": percentile(self.snapshot_sizes, 0.5),
+                "snapshot_bytes_max": max(self.snapshot_sizes, default=0),
+                "clients": [{"skin": client.skin,
+                             "down_bytes_per_second": client.bytes_sent / seconds,
+                             "up_bytes_per_second": client.bytes_received / seconds,
+                             "skipped_snapshots": client.skipped}
+                            for client in self.clients.values()]}
+
+
+class NetClient:
+    """ Sends one player's button to a NetServer and rebuilds the world from
+    its snapshots. state is the newest snapshot and prev_state the one
+    before, for drawing in between. """
+
+    def __init__(self, host="127.0.0.1", port=c.NET_PORT, skin=1):
+        self.server = (socket.gethostbyname(host), port)
+        self.skin = skin
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+
+        self.slot = None
+        self.skins = None
+        self.room_num = None
+        self.states = {}
+        self.tick = -1
+        self.prev_tick = -1
+        self.state = {}
+        self.prev_state = {}
+        self.since_state = 0
+        self.inputs = []
+        self.seq = 0
+        self.since_send = 1
+        self.bytes_received = 0
+
+    @property
+    def joined(self):
+        return self.slot is not None
+
+    @property
+    def over(self):
+        return bool(self.state) and self.state["s"][1] == 1
+
+    def press(self):
+        self.seq += 1
+        self.inputs.append([self.seq, 1])
+
+    def release(self):
+        self.seq += 1
+        self.inputs.append([self.seq, 0])
+
+    def send(self, message):
+        self.sock.sendto(encode(message), self.server)
+
+    def poll(self, dt):
+        self.since_send += dt
+        self.since_state += dt
+        got_snapshot = False
+        while True:
+            try:
+                packet, addr = self.sock.recvfrom(65536)
+            except (BlockingIOError, ConnectionResetError):
+                break
+            if addr != self.server:
+                continue
+            self.bytes_received += len(packet)
+            try:
+                message = decode(packet)
+            except (zlib.error, ValueError):
+                continue
+            if message["k"] == "welcome":
+                self.slot = message["slot"]
+                self.skins = message["skins"]
+                self.room_num = message["room"]
+            elif message["k"] == "snap":
+                got_snapshot = self.apply(message) or got_snapshot
+
+        if not self.joined:
+            if self.since_send > 0.25:
+                self.send({"k": "join", "skin": self.skin})
+                self.since_send = 0
+        elif got_snapshot or (self.inputs and self.since_send > 0.05) or self.since_send > 0.5:
+            self.send({"k": "in", "a": self.tick, "i": self.inputs})
+            self.since_send = 0
+
+    def apply(self, message):
+        tick = message["t"]
+        base = self.states.get(message["b"]) if message["b"] >= 0 else {}
+        if tick <= self.tick or base is None:
+            return False
+        self.prev_state = self.state
+        self.state = patch(base, message["d"])
+        self.states[tick] = self.state
+        for old in sorted(self.states)[:-c.NET_HISTORY]:
+            del self.states[old]
+        self.prev_tick = self.tick
+        self.tick = tick
+        self.since_state = 0
+        self.inputs = [item for item in self.inputs if item[0] > message["a"]]
+        return True
+
+
+def loopback(players=2, seconds=60, snapshot_rate=c.NET_SNAPSHOT_RATE, seed=0):
+    """ A server and bot clients talking over localhost UDP in one thread,
+    stepped as fast as possible. Checks every client ends up with exactly
+    the snapshots the server sent, and returns the server's report. """
+    game = Game(headless=True)
+    server = NetServer(players, port=0, seed=seed, snapshot_rate=snapshot_rate, game=game)
+    clients = [NetClient("127.0.0.1", server.port, skin=i + 1) for i in range(players)]
+    bots = random.Random(seed)
+    held = [False for _ in clients]
+    steps = 0
+    while not server.finished and steps < seconds * c.SIM_FPS:
+        for i, client in enumerate(clients):
+            if client.joined and bots.random() < 0.03:
+                held[i] = not held[i]
+                client.press() if held[i] else client.release()
+            client.poll(c.SIM_DT)
+        server.poll()
+        server.step()
+        if server.match is not None:
+            steps += 1
+
+    report = server.report()
+    report["in_sync"] = all(client.state == server.history.get(client.tick) for client in clients)
+    return report
+
+
+class ClientScene(RoomScene):
+    """ A round drawn from a NetClient's snapshots instead of simulated.
+    Objects are moved to where the server says they are, blended between
+    the last two snapshots, and the effects and sounds that go with things
+    appearing and disappearing are played here.
+
+    The snapshot blend is the only interpolation networked objects get:
+    place() sets their prev_* and current positions to the same blended
+    point, so drawing doesn't blend them a second time. Local particles
+    still interpolate with the frame alpha. """
+
+    def __init__(self, game, client, key):
+        super().__init__(game, room_num=client.room_num, seed=0)
+        self.client = client
+        self.key = key
+
+    def setup(self):
+        super().setup()
+        self.net_bullets = {}
+        self.net_powerups = {}
+        self.broken = set()
+
+    def blend(self, alpha=0):
+        """ How far to draw between the last two snapshots, alpha steps
+        after the last update """
+        client = self.client
+        interval = (client.tick - client.prev_tick) * c.SIM_DT
+        if client.prev_tick < 0 or interval <= 0:
+            return 1
+        return min((client.since_state + alpha * c.SIM_DT) / interval, 1)
+
+    def values(self, key, blend):
+        """ An entry of the state, blended with the previous snapshot's """
+        new = self.client.state[key]
+        old = self.client.prev_state.get(key)
+        if old is None or len(old) != len(new):
+            return new
+        return [c.lerp(a, b, blend) for a, b in zip(old, new)]
+
+    def update(self, dt, events):
+        self.age += dt
+        for event in events:
+            if event.type == pygame.KEYDOWN and event.key == self.key:
+                self.client.press()
+            elif event.type == pygame.KEYUP and event.key == self.key:
+                self.client.release()
+        self.client.poll(dt)
+
+        if self.client.state:
+            self.apply(self.client.state)
+            self.place(self.blend())
+
+        self.room.update(dt, events)
+        self.game.trails.update(dt, events)
+        self.game.particles.update(dt, events)
+        self.game.top_particles.update(dt, events)
+        for bullet in self.game.bullets:
+            bullet.age += dt
+        for powerup in self.game.powerups:
+            powerup.age += dt
+        self.shake_mag *= 0.1**dt
+        self.shake_mag = c.approach(self.shake_mag, 0, -20*dt)
+
+        if self.client.over and self.black_alpha >= 255:
+            self.over = True
+            self.record_winners()
+
+    def draw(self, surface, alpha=1):
+        if self.client.state:
+            self.place(self.blend(alpha))
+        return super().draw(surface, alpha)
+
+    def apply(self, state):
+        """ Creates, removes and updates everything in the snapshot, apart
+        from where it is drawn """
+        countdown, over, black_alpha = state["s"]
+        self.countdown = countdown / 100
+        self.is_over = bool(over)
+        self.black_alpha = black_alpha
+        for i, player in enumerate(self.players):
+            self.apply_player(player, state[f"p{i}"])
+        self.apply_bullets(state)
+        self.apply_powerups(state)
+
+        width = self.room.width
+        for idx in state["t"]:
+            if idx not in self.broken:
+                self.broken.add(idx)
+                self.room.break_if_breakable_at(idx % width, idx // width)
+
+    def place(self, blend):
+        """ Moves every networked object to its blended position """
+        for i, player in enumerate(self.players):
+            x, y, angle = self.values(f"p{i}", blend)[:3]
+            player.x = player.prev_x = x / POSITION_SCALE
+            player.y = player.prev_y = y / POSITION_SCALE
+            player.angle = player.prev_angle = angle / ANGLE_SCALE
+        for key, bullet in self.net_bullets.items():
+            x, y = self.values(key, blend)
+            bullet.x = bullet.prev_x = x / POSITION_SCALE
+            bullet.y = bullet.prev_y = y / POSITION_SCALE
+        for key, powerup in self.net_powerups.items():
+            powerup.y_offset = powerup.prev_y_offset = self.values(key, blend)[3] / POSITION_SCALE
+
+    def apply_player(self, player, values):
+        hp, dead, charged, charging, blinking = values[3:8]
+        if hp < player.hp:
+            self.game.player_hurt_noise.play()
+            self.shake(10)
+        player.hp = hp
+        if dead and not player.dead:
+            player.die()
+        player.charged = charged / 100
+        if charging and not player.charging:
+            player.charging = True
+        elif not charging and player.charging:
+            self.game.shoot_noise.play()
+            player.charging = False
+        player.since_damage = 0 if blinking else 1
+
+        for effect_id, age in enumerate(values[8:], start=1):
+            effect = next((item for item in player.effects if item.id == effect_id), None)
+            if age < 0:
+                if effect is not None:
+                    player.effects.remove(effect)
+                continue
+            if effect is None:
+                effect = EFFECTS[effect_id](player)
+            effect.age = age / 10
+
+    def apply_bullets(self, state):
+        for key in [key for key in self.net_bullets if key not in state]:
+            self.net_bullets.pop(key).destroy()
+        for key, values in state.items():
+            if key[0] == "b" and key not in self.net_bullets:
+                pos = [value / POSITION_SCALE for value in values]
+                bullet = Bullet(self.game, self.players[0], pos)
+                self.game.bullets.append(bullet)
+                self.net_bullets[key] = bullet
+
+    def apply_powerups(self, state):
+        for key in [key for key in self.net_powerups if key not in state]:
+            powerup = self.net_powerups.pop(key)
+            Powerup.collected_by(powerup, None)
+        for key, values in state.items():
+            if key[0] != "u":
+                continue
+            powerup = self.net_powerups.get(key)
+            if powerup is None:
+                kind, x, y = values[:3]
+                powerup = POWERUP_KINDS[kind](self.game, pos=(x, y))
+                self.game.powerups.append(powerup)
+                self.net_powerups[key] = powerup
+            if values[4] and not powerup.landed:
+                self.game.powerup_land_noise.play()
+            powerup.landed = bool(values[4])
+
+
+def run_client(host, port, skin, key_name):
+    """ Joins a server and plays one round in a window """
+    game = Game()
+    key = pygame.key.key_code(key_name)
+    client = NetClient(host, port, skin)
+    font = game.text.font("yoster.ttf", 30)
+    while not client.joined:
+        dt, _ = game.update_globals()
+        client.poll(dt)
+        game.screen.fill((0, 0, 0))
+        text = font.render(f"Connecting to {host}:{port}", True, (255, 255, 255))
+        game.screen.blit(text, text.get_rect(center=(c.WINDOW_WIDTH//2, c.WINDOW_HEIGHT//2)))
+        game.flip()
+
+    game.skin_list = client.skins
+    game.key_list = [key if i == client.slot else None for i in range(len(client.skins))]
+    game.win_list = [0 for _ in client.skins]
+    game.finish_loading()
+    game.current_scene = ClientScene(game, client, key)
+    game.current_scene.main()
+    print(f"Winners: {[skin for skin, wins in zip(game.skin_list, game.win_list) if wins]}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Network play over UDP")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve = commands.add_parser("server", help="run a round for remote players")
+    serve.add_argument("--players", type=int, default=2)
+    serve.add_argument("--host", default="0.0.0.0")
+    serve.add_argument("--port", type=int, default=c.NET_PORT)
+    serve.add_argument("--room", type=int)
+    serve.add_argument("--rate", type=int, default=c.NET_SNAPSHOT_RATE, help="snapshots per second")
+    join = commands.add_parser("client", help="join a server and play")
+    join.add_argument("--host", default="127.0.0.1")
+    join.add_argument("--port", type=int, default=c.NET_PORT)
+    join.add_argument("--skin", type=int, default=1)
+    join.add_argument("--key", default="space", help="name of the key to play with")
+    test = commands.add_parser("loopback", help="measure a bot round over localhost")
+    test.add_argument("--players", type=int, default=2)
+    test.add_argument("--seconds", type=float, default=60)
+    test.add_argument("--rate", type=int, default=c.NET_SNAPSHOT_RATE, help="snapshots per second")
+    args = parser.parse_args(argv)
+
+    if args.command == "server":
+        server = NetServer(args.players, args.host, args.port, args.room, snapshot_rate=args.rate)
+        print(f"Waiting for {args.players} players on port {server.port}", file=sys.stderr)
+        print(json.dumps(server.run(), indent=2))
+    elif args.command == "client":
+        run_client(args.host, args.port, args.skin, args.key)
+    else:
+        report = loopback(args.players, args.seconds, args.rate)
+        print(json.dumps(report, indent=2))
+        return 0 if report["in_sync"] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,114 +1,345 @@
 import pygame
-import random
+import numpy as np
 
-
-from enemy import Enemy
-from sprite_tools import SpriteSheet, Sprite
+from room import BLOCKING
+from sprite_tools import ScaleCache, get_sprite_sheet
 import constants as c
 
+# Rows of ParticleSystem.data, one column per particle
+_FIELDS = ["x", "y", "prev_x", "prev_y", "vx", "vy", "angle", "prev_angle",
+           "rotation", "age", "duration", "drag", "radius", "surface", "collision"]
+(_X, _Y, _PREV_X, _PREV_Y, _VX, _VY, _ANGLE, _PREV_ANGLE,
+ _ROTATION, _AGE, _DURATION, _DRAG, _RADIUS, _SURFACE, _COLLISION) = range(len(_FIELDS))
+
+# How a particle collides with walls: not at all, by stopping when its
+# center enters one, or by sliding its circle along them
+COLLIDE_NONE = 0
+COLLIDE_POINT = 1
+COLLIDE_CIRCLE = 2
+
+# Fraction of a particle's speed into a wall that it bounces back with
+WALL_BOUNCE = 0.2
+
+# Offsets of the 3x3 block of cells around a particle, as column vectors
+_NEIGHBOR_DX = np.repeat([-1, 0, 1], 3)[:, None]
+_NEIGHBOR_DY = np.tile([-1, 0, 1], 3)[:, None]
+
+
 class Particle:
+    """ Spawns one tumbling, sliding particle into game.particles """
+    collision = COLLIDE_CIRCLE
+
+    def __init__(self, game, surface, duration=None, position=(0, 0), velocity=(0, 0), rotation=0, drag = 0.05, key=None):
+        game.particles.spawn(surface,
+                             key=key,
+                             duration=duration,
+                             position=position,
+                             velocity=velocity,
+                             rotation=rotation,
+                             drag=drag,
+                             collision=self.collision)
+
+
+class BulletHit:
+    """ Spawns an impact flash into game.top_particles """
+    collision = COLLIDE_NONE
+
+    def __init__(self, game, position=(0, 0)):
+        game.top_particles.spawn(None, duration=0.4, position=position, drag=1, collision=self.collision)
 
-    def __init__(self, game, surface, duration=None, position=(0, 0), velocity=(0, 0), rotation=0, drag = 0.05):
+
+class ParticleSystem:
+    """ All particles of one draw layer, stored structure-of-arrays style in
+    the rows of a NumPy array. Each frame the whole batch is integrated, aged
+    and culled with a handful of array operations; dead particles are
+    compacted away in bulk. """
+
+    def __init__(self, game, capacity=256):
         self.game = game
-        self.surf = surface
-        self.duration = duration
-        self.velocity = list(velocity)
-        self.x, self.y = position
-        self.rotation = rotation
-        self.angle = random.random()*360
-        self.game.particles.add(self)
-        self.drag = drag
-        self.radius = 5
-        self.age = 0
-
-        self._bump_tile = Enemy.bump_tile
-        self._check_tile_collisions = Enemy.check_tile_collisions
+        self.data = np.zeros((len(_FIELDS), capacity))
+        self.count = 0
+        # This round's sprites, and their rotations from game.get_rotation_cache
+        self.surfaces = []
+        self.rotations = []
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        self.count = 0
+        self.surfaces = []
+        self.rotations = []
+
+    def surface_index(self, surface, key=None):
+        """ Index of a sprite in this round's list. Its rotations are shared
+        with every round through the game's caches, under key if given, so
+        sprites rebuilt each round should pass one. """
+        if surface is None:
+            return -1
+        for idx, item in enumerate(self.surfaces):
+            if item is surface:
+                return idx
+        self.surfaces.append(surface)
+        self.rotations.append(self.game.get_rotation_cache(key if key is not None else surface, surface))
+        return len(self.surfaces) - 1
+
+    def spawn(self, surface, duration=None, position=(0, 0), velocity=(0, 0), rotation=0, drag=0.05, radius=5, collision=COLLIDE_CIRCLE, key=None):
+        if self.count == self.data.shape[1]:
+            self.data = np.concatenate((self.data, np.zeros_like(self.data)), axis=1)
+        if duration is None:
+            duration = np.inf
+        x, y = position
+        vx, vy = velocity
+        angle = self.game.rng.random()*360
+        idx = self.count
+        # Same order as _FIELDS
+        self.data[:, idx] = (x, y, x, y, vx, vy, angle, angle,
+                             rotation, 0, duration, drag, radius,
+                             self.surface_index(surface, key), collision)
+        self.count += 1
+        return idx
 
     def update(self, dt, events):
-        self.velocity[0] *= self.drag**dt
-        self.velocity[1] *= self.drag**dt
-        self.x += self.velocity[0] * dt
-        self.y += self.velocity[1] * dt
-        self.angle += self.rotation * dt
-        self.rotation *= 0.5**dt
-        if self.duration is not None:
-            self.duration -= dt
-            if self.duration <= 0:
-                self.destroy()
+        n = self.count
+        if not n:
+            return
+        d = self.data
+        d[_PREV_X, :n] = d[_X, :n]
+        d[_PREV_Y, :n] = d[_Y, :n]
+        d[_PREV_ANGLE, :n] = d[_ANGLE, :n]
 
-        self.age += dt
+        slow = d[_DRAG, :n] ** dt
+        d[_VX, :n] *= slow
+        d[_VY, :n] *= slow
+        d[_X, :n] += d[_VX, :n] * dt
+        d[_Y, :n] += d[_VY, :n] * dt
+        d[_ANGLE, :n] += d[_ROTATION, :n] * dt
+        d[_ROTATION, :n] *= 0.5**dt
+        d[_DURATION, :n] -= dt
+        d[_AGE, :n] += dt
 
-        self.check_tile_collisions()
+        alive = d[_DURATION, :n] > 0
+        self.check_tile_collisions(alive)
+        if not alive.all():
+            keep = np.flatnonzero(alive)
+            d[:, :len(keep)] = d[:, keep]
+            self.count = len(keep)
 
-    def bump_tile(self, *args, **kwargs):
-        self._bump_tile(self, *args, **kwargs)
+    def check_tile_collisions(self, alive):
+        room = self.game.room
+        if room is None:
+            return
+        d = self.data
+        n = self.count
+        collision = d[_COLLISION, :n]
+        points = np.flatnonzero(alive & (collision == COLLIDE_POINT))
+        if len(points):
+            self.collide_points(room, points)
+        circles = alive & (collision == COLLIDE_CIRCLE)
+        circles[circles] = room.near_blocking_at(d[_X, :n][circles], d[_Y, :n][circles])
+        circles = np.flatnonzero(circles)
+        if len(circles):
+            self.collide_circles(room, circles)
 
-    def check_tile_collisions(self):
-        self._check_tile_collisions(self)
+    def collide_points(self, room, idx):
+        """ Particles whose centers moved into a wall go back and bounce """
+        d = self.data
+        idx = idx[room.blocking_at(d[_X, idx], d[_Y, idx])]
+        d[_X, idx] = d[_PREV_X, idx]
+        d[_Y, idx] = d[_PREV_Y, idx]
+        d[_VX, idx] *= -WALL_BOUNCE
+        d[_VY, idx] *= -WALL_BOUNCE
 
-    def destroy(self):
-        self.game.particles.remove(self)
+    def collide_circles(self, room, idx):
+        """ Pushes each particle's circle out of the first wall it overlaps
+        in the 3x3 block around it, all particles at once """
+        d = self.data
+        xs, ys = d[_X, idx], d[_Y, idx]
+        radii = d[_RADIUS, idx]
+        cell_xs, cell_ys = room.cells_at(xs, ys)
+        # One row per neighbor, column by column like Room.blocking_neighbors
+        tile_xs = cell_xs + _NEIGHBOR_DX
+        tile_ys = cell_ys + _NEIGHBOR_DY
+        walls = room.flags_at_cells(tile_xs.ravel(), tile_ys.ravel()).reshape(tile_xs.shape) & BLOCKING != 0
+        half = c.TILE_SIZE/2
+        centers_x = room.cell_origin[0] + c.TILE_SIZE * tile_xs
+        centers_y = room.cell_origin[1] + c.TILE_SIZE * tile_ys
+        # Offset from the nearest point of each tile
+        near_x = xs - np.clip(xs, centers_x - half, centers_x + half)
+        near_y = ys - np.clip(ys, centers_y - half, centers_y + half)
+        dist = np.hypot(near_x, near_y)
+        hits = walls & (dist < radii)
+        hit = np.flatnonzero(hits.any(axis=0))
+        if not len(hit):
+            return
+        first = hits[:, hit].argmax(axis=0)
+        near_x, near_y, dist = near_x[first, hit], near_y[first, hit], dist[first, hit]
+        off_x = xs[hit] - centers_x[first, hit]
+        off_y = ys[hit] - centers_y[first, hit]
+        radii = radii[hit]
+        idx = idx[hit]
 
-    def draw(self, surface, offset=(0, 0)):
-        surf = pygame.transform.rotate(self.surf, self.angle)
-        x = self.x - surf.get_width()//2 + offset[0]
-        y = self.y - surf.get_height()//2 + offset[1]
-        surface.blit(surf, (x, y))
+        # Push out along the offset from the tile, or the shallowest way if
+        # the center is inside it
+        inside = dist == 0
+        sideways = np.where(inside, np.abs(off_x) > np.abs(off_y), np.abs(near_x) > np.abs(near_y))
+        scale = (radii + 1) / np.where(inside, 1, dist)
+        out = half + radii + 1
+        d[_X, idx] = np.where(inside,
+                              np.where(sideways, d[_X, idx] - off_x + np.copysign(out, off_x), d[_X, idx]),
+                              d[_X, idx] - near_x + near_x * scale)
+        d[_Y, idx] = np.where(inside,
+                              np.where(sideways, d[_Y, idx], d[_Y, idx] - off_y + np.copysign(out, off_y)),
+                              d[_Y, idx] - near_y + near_y * scale)
+        d[_VX, idx] *= np.where(sideways, -WALL_BOUNCE, 1)
+        d[_VY, idx] *= np.where(sideways, 1, -WALL_BOUNCE)
+
+    def interpolated(self, alpha, offset=(0, 0)):
+        """ Screen positions and angles blended alpha of the way from the
+        previous step to the current one """
+        n = self.count
+        d = self.data
+        xs = d[_PREV_X, :n] + (d[_X, :n] - d[_PREV_X, :n]) * alpha + offset[0]
+        ys = d[_PREV_Y, :n] + (d[_Y, :n] - d[_PREV_Y, :n]) * alpha + offset[1]
+        angles = d[_PREV_ANGLE, :n] + (d[_ANGLE, :n] - d[_PREV_ANGLE, :n]) * alpha
+        return xs.tolist(), ys.tolist(), angles.tolist()
+
+    def mark_dirty(self, region, alpha=1):
+        """ Adds the area every particle will draw over to a DirtyRegion """
+        if not self.count:
+            return
+        xs, ys, _ = self.interpolated(alpha)
+        reach = max(max(surface.get_size()) for surface in self.surfaces) * 0.75
+        region.add_points(xs, ys, reach)
+
+    def draw(self, surface, offset=(0, 0), alpha=1):
+        if not self.count:
+            return
+        xs, ys, angles = self.interpolated(alpha, offset)
+        indices = self.data[_SURFACE, :self.count].astype(int).tolist()
+        blits = []
+        for x, y, angle, idx in zip(xs, ys, angles, indices):
+            surf = self.rotations[idx].get(angle)
+            blits.append((surf, (x - surf.get_width()//2, y - surf.get_height()//2)))
+        surface.blits(blits, doreturn=False)
 
-class BulletHit(Particle):
-    def __init__(self, game, position=(0, 0)):
-        super().__init__(game, None, position=position)
-        self.sprite = Sprite(16)
-        anim = SpriteSheet(c.image_path("bullet_hit.png"), (8, 1), 8)
-        self.sprite.add_animation({"Default": anim})
-        self.sprite.start_animation("Default")
-        self.game.top_particles.add(self)
+
+class BulletHitSystem(ParticleSystem):
+    """ Impact flashes where bullets were destroyed. Both the sprite sheet
+    frame and the expanding, fading circle are functions of particle age. """
+
+    fps = 16
+
+    def __init__(self, game, capacity=64):
+        super().__init__(game, capacity=capacity)
+        self.sheet = get_sprite_sheet(c.image_path("bullet_hit.png"), (8, 1), 8, game.assets.image)
+        for frame in self.sheet.frames:
+            game.assets.rle(frame, "particles")
 
         surface = pygame.Surface((100, 100))
         surface.fill((0, 0, 0))
         pygame.draw.circle(surface, (255, 255, 255), (50, 50), 50)
+        surface.set_colorkey((0, 0, 0))
         self.boom = surface
-        self.boom.set_colorkey((0, 0, 0))
-        self.boom_alpha = 200
-        self.boom_size = 40
+        # The boom grows 600 px/s, about 9 px a step, so 8 px sizes don't show
+        self.boom_sizes = game.assets.track_scales(ScaleCache(surface, quantum=8))
 
-    def update(self, dt, events):
-        self.age += dt
-        self.boom_alpha -= 1600*dt
-        self.boom_size += 600*dt
-        self.sprite.update(dt)
-        if self.age > 0.4:
-            self.destroy()
+    def mark_dirty(self, region, alpha=1):
+        if not self.count:
+            return
+        xs, ys, _ = self.interpolated(alpha)
+        ages = self.data[_AGE, :self.count].tolist()
+        for x, y, age in zip(xs, ys, ages):
+            frame = self.sheet.get_frame(int(age * self.fps))
+            reach = max(max(frame.get_size()), 40 + 600*age)/2 + 1
+            region.add_rect((x - reach, y - reach, reach*2, reach*2))
 
-    def draw(self, surface, offset=(0, 0)):
-        x = self.x + offset[0]
-        y = self.y + offset[1]
-        self.sprite.set_position((x, y))
-        self.sprite.draw(surface)
-
-        boom = pygame.transform.scale(self.boom, (int(self.boom_size), int(self.boom_size)))
-        boom.set_alpha(self.boom_alpha)
-        surface.blit(boom, (x - self.boom_size//2, y - self.boom_size//2))
-
-    def destroy(self):
-        super().destroy()
-        self.game.top_particles.remove(self)
-
-class TrailBit(Particle):
-    def __init__(self, game, owner, **kwargs):
-        surface = pygame.Surface((24, 24))
-        surface.fill((0, 0, 0))
-        self.owner = owner
-        color = (255, 255, 255)
-        pygame.draw.circle(surface, color, (12, 12), 12)
-        surface.set_colorkey((0, 0, 0))
-        super().__init__(game, surface, **kwargs)
-        self.duration = 1
-        self.start_alpha = 50
+    def draw(self, surface, offset=(0, 0), alpha=1):
+        if not self.count:
+            return
+        xs, ys, _ = self.interpolated(alpha, offset)
+        ages = self.data[_AGE, :self.count].tolist()
+        for x, y, age in zip(xs, ys, ages):
+            frame = self.sheet.get_frame(int(age * self.fps))
+            surface.blit(frame, (int(x - frame.get_width()/2), int(y - frame.get_height()/2)))
+
+            boom_alpha = 200 - 1600*age
+            if boom_alpha < 1:
+                # Faded out an eighth of a second in
+                continue
+            boom_size = 40 + 600*age
+            boom = self.boom_sizes.get((boom_size, boom_size))
+            boom.set_alpha(boom_alpha)
+            surface.blit(boom, (x - boom.get_width()//2, y - boom.get_height()//2))
+
+class TrailPool:
+    """ Fading circles left behind bullets.
+
+    Every trail bit lives for the same amount of time, so bits are kept in a
+    ring buffer of preallocated slots: new bits go on the end, expired bits
+    come off the front, and the slots are reused. All bits share one
+    pre-rendered circle per alpha level and never collide with tiles. """
+
+    def __init__(self, game, capacity=8192, lifetime=0.5, start_alpha=50, radius=12):
+        self.game = game
+        self.capacity = capacity
+        self.lifetime = lifetime
+        self.start_alpha = start_alpha
+        self.radius = radius
+
+        self.xs = [0] * capacity
+        self.ys = [0] * capacity
+        self.born = [0] * capacity
+        self.head = 0
+        self.count = 0
+        self.now = 0
+
+        self.surfaces = []
+        for alpha in range(start_alpha + 1):
+            surface = pygame.Surface((radius*2, radius*2))
+            surface.fill((0, 0, 0))
+            pygame.draw.circle(surface, (255, 255, 255), (radius, radius), radius)
+            surface.set_colorkey((0, 0, 0))
+            surface.set_alpha(alpha)
+            self.surfaces.append(game.assets.rle(surface, "particles"))
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        self.head = 0
+        self.count = 0
+
+    def spawn(self, x, y):
+        if self.count == self.capacity:
+            # Out of slots, so recycle the oldest bit
+            self.head = (self.head + 1) % self.capacity
+            self.count -= 1
+        idx = (self.head + self.count) % self.capacity
+        self.xs[idx] = x
+        self.ys[idx] = y
+        self.born[idx] = self.now
+        self.count += 1
 
     def update(self, dt, events):
-        super().update(dt, events)
-        alpha = (self.duration - self.age)*self.start_alpha
-        self.surf.set_alpha(alpha)
-        if self.age > self.duration:
-            self.destroy()
+        self.now += dt
+        while self.count and self.now - self.born[self.head] >= self.lifetime:
+            self.head = (self.head + 1) % self.capacity
+            self.count -= 1
+
+    def mark_dirty(self, region):
+        if not self.count:
+            return
+        idx = [(self.head + i) % self.capacity for i in range(self.count)]
+        region.add_points([self.xs[i] for i in idx], [self.ys[i] for i in idx], self.radius)
+
+    def draw(self, surface, offset=(0, 0)):
+        blits = []
+        for i in range(self.count):
+            idx = (self.head + i) % self.capacity
+            level = int(self.start_alpha * (1 - (self.now - self.born[idx])/self.lifetime))
+            if level > 0:
+                x = self.xs[idx] - self.radius + offset[0]
+                y = self.ys[idx] - self.radius + offset[1]
+                blits.append((self.surfaces[level], (x, y)))
+        surface.blits(blits, doreturn=False)
@@ -43,6 +43,7 @@ class Player:
         self.angle = 0 # degrees CCW from right
 
         self.x, self.y = self.game.room.spawns[player_num]
+        self.prev_x, self.prev_y, self.prev_angle = self.x, self.y, self.angle
 
         self.velocity = [0, 0]
 
@@ -55,14 +56,14 @@ class Player:
                             5: (255, 255, 255)}
         self.color = self.color_dict[self.skin]
 
-        self.surf = pygame.image.load(c.image_path(f"player_{skin}.png"))
-        self.dead_surf = pygame.image.load(c.image_path(f"player_{skin}_dead.png"))
+        self.surf = self.game.get_static(c.image_path(f"player_{skin}.png"), "sprites")
+        self.dead_surf = self.game.get_static(c.image_path(f"player_{skin}_dead.png"), "sprites")
         self.blink_surf = pygame.mask.from_surface(self.surf).to_surface().convert()
         self.blink_surf.set_colorkey((0, 0, 0))
-        self.legs_1 = pygame.image.load(c.image_path(f"legs_1_{skin}.png"))
+        self.legs_1 = self.game.get_static(c.image_path(f"legs_1_{skin}.png"), "sprites")
         self.blink_legs_1 = pygame.mask.from_surface(self.legs_1).to_surface().convert()
         self.blink_legs_1.set_colorkey((0, 0, 0))
-        self.legs_2 = pygame.image.load(c.image_path(f"legs_2_{skin}.png"))
+        self.legs_2 = self.game.get_static(c.image_path(f"legs_2_{skin}.png"), "sprites")
         self.blink_legs_2 = pygame.mask.from_surface(self.legs_2).to_surface().convert()
         self.blink_legs_2.set_colorkey((0, 0, 0))
         self.leg_step_amt = 15
@@ -72,6 +73,7 @@ class Player:
         self.shadow.set_colorkey((255, 255, 255))
         self.shadow.set_alpha(60)
         pygame.draw.circle(self.shadow, (0, 0, 0), (self.shadow.get_width()//2, self.shadow.get_height()//2), self.shadow.get_width()//2)
+        self.game.assets.rle(self.shadow, "shadows")
 
         self.one_leg = pygame.Surface((22, 29))
         self.one_leg.fill((255, 255, 0))
@@ -84,10 +86,26 @@ class Player:
         self.dead = False
 
         self.hp = 100
-        self.arrow = pygame.image.load(c.image_path("arrow.png"))
+        self.arrow = self.game.get_static(c.image_path("arrow.png"), "sprites")
         self.arrow.set_colorkey((0, 0, 0))
 
-    def draw_arrow(self, surface, offset=(0, 0)):
+        # Rotations are shared between rounds, so each skin is only rotated once
+        self.rotated = {name: self.game.get_rotation_cache((name, skin), surf) for name, surf in
+                        [("body", self.surf),
+                         ("dead", self.dead_surf),
+                         ("blink", self.blink_surf),
+                         ("legs_1", self.legs_1),
+                         ("blink_legs_1", self.blink_legs_1),
+                         ("legs_2", self.legs_2),
+                         ("blink_legs_2", self.blink_legs_2)]}
+        self.rotated_arrow = self.game.get_rotation_cache(("arrow",), self.arrow)
+
+    def draw_arrow(self, surface, offset=(0, 0), pos=None, angle=None):
+        if pos is None:
+            pos = self.x, self.y
+        if angle is None:
+            angle = self.angle
+        px, py = pos
         post_threshold = min(self.charged/self.get(CHARGE_TIME) - self.charge_threshold, 1-self.charge_threshold)/(1-self.charge_threshold)
         if post_threshold <= 0 or not self.charging:
             return
@@ -97,12 +115,12 @@ class Player:
             if self.has_powerup(c.DOUBLE_SHOT):
                 angle_offsets = [-15, 15]
             for angle_offset in angle_offsets:
-                self.angle += angle_offset
+                arrow_angle = angle + angle_offset
                 distance = post_threshold * 100
-                x, y = self.get_direction_vector()
-                arrow = pygame.transform.rotate(self.arrow, self.angle)
-                x = x*distance + self.x - arrow.get_width()//2 + offset[0]
-                y = y*distance + self.y - arrow.get_height()//2 + offset[1]
+                x, y = self.get_direction_vector(arrow_angle)
+                arrow = self.rotated_arrow.get(arrow_angle)
+                x = x*distance + px - arrow.get_width()//2 + offset[0]
+                y = y*distance + py - arrow.get_height()//2 + offset[1]
                 min_x, min_y, w, h = self.game.room.get_rect()
 
                 if x > min_x and y > min_y and x < min_x + w - arrow.get_width() and y < min_y + h - arrow.get_height():
@@ -110,21 +128,19 @@ class Player:
 
                 along = 0
                 while along < distance - 15:
-                    x, y = self.get_direction_vector()
-                    x = x*along + self.x + offset[0]
-                    y = y*along + self.y + offset[1]
+                    x, y = self.get_direction_vector(arrow_angle)
+                    x = x*along + px + offset[0]
+                    y = y*along + py + offset[1]
                     if x > min_x + 3 and y > min_y + 3 and x < min_x - 3 + w and y < min_y + h - 3:
                         pygame.draw.circle(surface, (255, 255, 255), (x, y), 3)
                     along += 16
 
-                self.angle -= angle_offset
-
     def bump_vel(self, x, y):
         self.velocity[0] += x
         self.velocity[1] += y
         self.game.bounce_noise.play()
         if self.dead:
-            self.props[SPIN_SPEED] = random.random() * 240 - 120
+            self.props[SPIN_SPEED] = self.game.rng.random() * 240 - 120
 
     def check_player_collisions(self):
         for player in self.game.current_scene.players:
@@ -147,35 +163,38 @@ class Player:
                     self.y = player.y - (self.radius + player.radius)*dy/mag
 
 
-    def legs_1_angle(self):
-        angle = self.angle - (self.angle % (self.leg_step_amt*2))
-        if self.angle % (self.leg_step_amt*2) < self.leg_step_amt:
-            angle += (self.angle % (self.leg_step_amt*2)) * 2
+    def legs_1_angle(self, body_angle=None):
+        if body_angle is None:
+            body_angle = self.angle
+        angle = body_angle - (body_angle % (self.leg_step_amt*2))
+        if body_angle % (self.leg_step_amt*2) < self.leg_step_amt:
+            angle += (body_angle % (self.leg_step_amt*2)) * 2
         else:
             angle += self.leg_step_amt * 2
         return angle
 
-    def legs_2_angle(self):
-        angle = self.angle - (self.angle % (self.leg_step_amt*2))
-        if self.angle % (self.leg_step_amt*2) < self.leg_step_amt:
+    def legs_2_angle(self, body_angle=None):
+        if body_angle is None:
+            body_angle = self.angle
+        angle = body_angle - (body_angle % (self.leg_step_amt*2))
+        if body_angle % (self.leg_step_amt*2) < self.leg_step_amt:
             pass
         else:
-            angle += ((self.angle % (self.leg_step_amt*2)) - self.leg_step_amt) * 2
+            angle += ((body_angle % (self.leg_step_amt*2)) - self.leg_step_amt) * 2
         return angle
 
     def check_tile_collisions(self):
         if self.game.room is None:
             return
         else:
-            x, y = self.game.room.world_to_cell(self.x, self.y, discrete=True)
-            for cell_x in [x-1, x, x+1]:
-                for cell_y in [y-1, y, y+1]:
-                    if self.game.room.cell_is_blocking(cell_x, cell_y):
-                        real_x, real_y = self.game.room.cell_to_world(cell_x, cell_y)
-                        if self.bump_tile(real_x, real_y):
-                            if c.mag(*self.velocity) > 5:
-                                self.game.bounce_noise.play()
-                            return
+            room = self.game.room
+            x, y = room.world_to_cell(self.x, self.y, discrete=True)
+            for cell_x, cell_y in room.blocking_neighbors(x, y):
+                real_x, real_y = room.cell_to_world(cell_x, cell_y)
+                if self.bump_tile(real_x, real_y):
+                    if c.mag(*self.velocity) > 5:
+                        self.game.bounce_noise.play()
+                    return
 
     def bump_tile(self, x, y):
         dx = x - self.x
@@ -225,18 +244,6 @@ class Player:
                     return True
             return False
 
-    def check_bullet_collisions(self):
-        if self.dead:
-            return
-        for bullet in list(self.game.bullets):
-            if bullet.x < self.x - self.radius - bullet.radius or bullet.x > self.x + self.radius + bullet.radius:
-                continue
-            if bullet.y < self.y - self.radius - bullet.radius or bullet.y > self.y + self.radius + bullet.radius:
-                continue
-            if math.sqrt((bullet.x - self.x)**2 + (bullet.y - self.y)**2) < self.radius + bullet.radius:
-                if self not in bullet.owner.friendly:
-                    self.get_hit_by(bullet)
-
     def get_hit_by(self, bullet):
         self.game.player_hurt_noise.play()
         self.hp -= bullet.damage
@@ -263,20 +270,21 @@ class Player:
         self.effects = []
         for i in range(8):
             angle = i/8 * 2 * math.pi + self.angle*math.pi/180
-            speed = random.random()**2*140 + 60
+            speed = self.game.rng.random()**2*140 + 60
             vx = speed * math.cos(angle) + self.velocity[0]*1
             vy = speed * -math.sin(angle) + self.velocity[1]*1
             Particle(self.game,
                 self.one_leg,
                 position=(self.x, self.y),
                 velocity=(vx, vy),
-                rotation=(random.random()*200 - 100))
+                rotation=(self.game.rng.random()*200 - 100),
+                key=("one_leg", self.skin))
 
 
-    def get_direction_vector(self):
-        x = math.cos(self.angle/180*math.pi)
-        y = -math.sin(self.angle/180*math.pi)
-        return x, y
+    def get_direction_vector(self, angle=None):
+        if angle is None:
+            angle = self.angle
+        return c.direction_vector(angle)
 
     def get_spin_velocity(self):
         if self.sailing:
@@ -314,9 +322,11 @@ class Player:
         self.bind_key(None)
 
     def update(self, dt, events):
+        self.prev_x, self.prev_y, self.prev_angle = self.x, self.y, self.angle
         x, y, w, h = self.game.room.get_rect()
         if self.x > x+w or self.y > y+h or self.x < x or self.y < y:
             self.x, self.y = c.WINDOW_WIDTH//2, c.WINDOW_HEIGHT//2
+            self.prev_x, self.prev_y = self.x, self.y
             pygame.display.set_caption("Spinnerets (definitely not riddled with bugs)")
         for effect in self.effects[::-1]:
             effect.update(dt, events)
@@ -330,7 +340,6 @@ class Player:
         if self.controller.is_released():
             self.up()
 
-        self.check_bullet_collisions()
         self.check_player_collisions()
 
         mag = c.mag(self.velocity[0], self.velocity[1])
@@ -357,51 +366,72 @@ class Player:
 
         self.check_tile_collisions()
 
-    def draw(self, surface, offset=(0, 0)):
+    def draw(self, surface, offset=(0, 0), alpha=1):
+        px = c.lerp(self.prev_x, self.x, alpha)
+        py = c.lerp(self.prev_y, self.y, alpha)
+        angle = c.lerp(self.prev_angle, self.angle, alpha)
+
         rx = (random.random() - 0.5) * self.get(MAX_SHAKE) * self.charged
         ry = (random.random() - 0.5) * self.get(MAX_SHAKE) * self.charged
 
-        xoff, yoff = self.get_direction_vector()
+        xoff, yoff = self.get_direction_vector(angle)
         xoff *= 10
         yoff *= 10
 
         if not self.dead:
             surf = self.shadow
-            x = self.x - surf.get_width()//2 + offset[0] + rx
-            y = self.y - surf.get_height()//2 + offset[1] + ry + 10
+            x = px - surf.get_width()//2 + offset[0] + rx
+            y = py - surf.get_height()//2 + offset[1] + ry + 10
             surface.blit(surf, (x, y))
 
-            legs = self.legs_1 if not self.blinking() else self.blink_legs_1
-            surf = pygame.transform.rotate(legs, self.legs_1_angle())
-            x = self.x - surf.get_width()//2 + offset[0] + rx + xoff
-            y = self.y - surf.get_height()//2 + offset[1] + ry + yoff
+            legs = "legs_1" if not self.blinking() else "blink_legs_1"
+            surf = self.rotated[legs].get(self.legs_1_angle(angle))
+            x = px - surf.get_width()//2 + offset[0] + rx + xoff
+            y = py - surf.get_height()//2 + offset[1] + ry + yoff
             surface.blit(surf, (x, y))
 
-            legs = self.legs_2 if not self.blinking() else self.blink_legs_2
-            surf = pygame.transform.rotate(legs, self.legs_2_angle())
-            x = self.x - surf.get_width()//2 + offset[0] + rx + xoff
-            y = self.y - surf.get_height()//2 + offset[1] + ry + yoff
+            legs = "legs_2" if not self.blinking() else "blink_legs_2"
+            surf = self.rotated[legs].get(self.legs_2_angle(angle))
+            x = px - surf.get_width()//2 + offset[0] + rx + xoff
+            y = py - surf.get_height()//2 + offset[1] + ry + yoff
             surface.blit(surf, (x, y))
 
-        self.draw_arrow(surface, offset=offset)
+        self.draw_arrow(surface, offset=offset, pos=(px, py), angle=angle)
 
-        body = self.surf if not self.blinking() else self.blink_surf
+        body = "body" if not self.blinking() else "blink"
         if self.dead and not self.blinking():
-            body = self.dead_surf
-        surf = pygame.transform.rotate(body, self.angle)
-        x = self.x - surf.get_width()//2 + offset[0] + rx
-        y = self.y - surf.get_height()//2 + offset[1] + ry
+            body = "dead"
+        surf = self.rotated[body].get(angle)
+        x = px - surf.get_width()//2 + offset[0] + rx
+        y = py - surf.get_height()//2 + offset[1] + ry
         surface.blit(surf, (x, y))
 
         effect_spacing = 24
-        x = self.x + offset[0] - effect_spacing/2 * (len(self.effects) - 1) - 12
-        y = self.y + offset[1] - 52
+        x = px + offset[0] - effect_spacing/2 * (len(self.effects) - 1) - 12
+        y = py + offset[1] - 52
         for effect in self.effects:
             if (effect.duration - effect.age) > 3.2 or effect.age % 0.4 < 0.2:
                 surface.blit(effect.icon, (x, y))
             x += effect_spacing
 
-        #pygame.draw.circle(surface, (255, 255, 100), (self.x + offset[0], self.y + offset[1]), self.radius, width=2)
+        #pygame.draw.circle(surface, (255, 255, 100), (px + offset[0], py + offset[1]), self.radius, width=2)
+
+    def dirty_rect(self, alpha=1):
+        """ Screen rect containing everything draw() can touch """
+        px = c.lerp(self.prev_x, self.x, alpha)
+        py = c.lerp(self.prev_y, self.y, alpha)
+        reach = max(max(surf.get_size()) for surf in (self.surf, self.legs_1, self.legs_2))*0.75
+        reach = max(reach + 10, self.shadow.get_width()//2 + 10)
+        reach += self.get(MAX_SHAKE) * self.charged / 2
+        if self.charging:
+            reach = max(reach, 100 + max(self.arrow.get_size())*0.75)
+        rect = pygame.Rect(px - reach, py - reach, reach*2, reach*2)
+        if self.effects:
+            icon_width = max(effect.icon.get_width() for effect in self.effects)
+            icon_height = max(effect.icon.get_height() for effect in self.effects)
+            width = 24 * (len(self.effects) - 1) + icon_width
+            rect.union_ip(pygame.Rect(px - 12*len(self.effects), py - 52, width, icon_height))
+        return rect
 
     def blinking(self):
         return self.since_damage < 0.18
@@ -435,7 +465,7 @@ class Player:
             xv *= self.get(BULLET_SPEED)
             yv *= self.get(BULLET_SPEED)
             new_bullet = Bullet(self.game, self, (self.x, self.y), (xv, yv), damage=self.get(DAMAGE))
-            self.game.bullets.add(new_bullet)
+            self.game.bullets.append(new_bullet)
             self.angle -= offset
 
     class ButtonController:
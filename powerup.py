@@ -10,6 +10,7 @@ class Powerup:
         self.game = game
         self.x, self.y = pos
         self.y_offset = -self.y
+        self.prev_y_offset = self.y_offset
         self.surface = surface
         self.shadow = pygame.Surface((self.radius*2, self.radius*2))
         self.shadow.fill((255, 255, 255))
@@ -17,9 +18,11 @@ class Powerup:
         self.shadow.set_alpha(40)
         self.landed = False
         pygame.draw.circle(self.shadow, (0, 0, 0), (self.radius, self.radius), self.radius)
+        self.shadow_sizes = self.game.get_scale_cache("powerup shadow", self.shadow)
         self.glow = self.game.get_static(c.image_path("glow.png"))
 
     def update(self, dt, events):
+        self.prev_y_offset = self.y_offset
         self.age += dt
         if self.landed:
             self.y_offset = 6 * math.sin(self.age * 6)
@@ -32,23 +35,31 @@ class Powerup:
                 self.game.powerup_land_noise.play()
         self.check_collisions()
 
-    def draw(self, surface, offset=(0, 0)):
+    def draw(self, surface, offset=(0, 0), alpha=1):
+        y_offset = c.lerp(self.prev_y_offset, self.y_offset, alpha)
 
         x = self.x + offset[0] - self.glow.get_width()//2
-        y = self.y + offset[1] - self.glow.get_height()//2 + self.y_offset - 30
+        y = self.y + offset[1] - self.glow.get_height()//2 + y_offset - 30
         surface.blit(self.glow, (x, y), special_flags = pygame.BLEND_RGBA_ADD)
 
         width = self.shadow.get_width()
         width -= 10
-        if (int(width + self.y_offset/2)) > 0:
-            shadow = pygame.transform.scale(self.shadow, (int(width + self.y_offset/2), int(width + self.y_offset/2)))
+        if (int(width + y_offset/2)) > 0:
+            shadow = self.shadow_sizes.get((int(width + y_offset/2), int(width + y_offset/2)))
             x = self.x + offset[0] - shadow.get_width()//2
             y = self.y + offset[1] - shadow.get_height()//2
             surface.blit(shadow, (x, y))
         x = self.x + offset[0] - self.surface.get_width()//2
-        y = self.y + offset[1] - self.surface.get_height()//2 + self.y_offset - 30
+        y = self.y + offset[1] - self.surface.get_height()//2 + y_offset - 30
         surface.blit(self.surface, (x, y))
 
+    def dirty_rect(self, alpha=1):
+        y_offset = c.lerp(self.prev_y_offset, self.y_offset, alpha)
+        rect = self.glow.get_rect(center=(self.x, self.y + y_offset - 30))
+        rect.union_ip(self.surface.get_rect(center=(self.x, self.y + y_offset - 30)))
+        rect.union_ip(self.shadow.get_rect(center=(self.x, self.y)))
+        return rect
+
     def check_collisions(self):
         for player in self.game.current_scene.players:
             if c.mag(player.x - self.x, player.y - self.y) < player.radius + self.radius and self.landed:
@@ -105,6 +116,14 @@ class FastShootingPowerup(Powerup):
         super().collected_by(player)
         FastShooting(player)
 
+# Seconds each effect lasts, by powerup id. Game.effect_durations starts
+# as a copy of this.
+EFFECT_DURATIONS = {c.FAST_SPINNING: 25,
+                    c.SLIPPERY_SOCKS: 18,
+                    c.DOUBLE_SHOT: 18,
+                    c.BOUNCY: 18,
+                    c.FAST_SHOOTING: 25}
+
 class Effect:
 
     def __init__(self, owner):
@@ -132,7 +151,7 @@ class FastSpin(Effect):
 
     def __init__(self, owner):
         self.id=c.FAST_SPINNING
-        self.duration = 25
+        self.duration = owner.game.effect_durations[self.id]
         super().__init__(owner)
         self.name = "Caffeine"
         self.description = "Spin to win"
@@ -145,7 +164,7 @@ class SlipperySocks(Effect):
         self.id=c.SLIPPERY_SOCKS
         self.name = "Slippery Socks"
         self.description = "There better be a bulk discount"
-        self.duration = 18
+        self.duration = owner.game.effect_durations[self.id]
         super().__init__(owner)
         self.icon = pygame.transform.scale2x(self.owner.game.get_static(c.image_path("socks_icon.png")))
 
@@ -155,7 +174,7 @@ class DoubleShot(Effect):
         self.id=c.DOUBLE_SHOT
         self.name = "Double Shot"
         self.description = "For that special someone you really want to shoot twice"
-        self.duration = 18
+        self.duration = owner.game.effect_durations[self.id]
         super().__init__(owner)
         self.icon = pygame.transform.scale2x(self.owner.game.get_static(c.image_path("double_icon.png")))
 
@@ -165,7 +184,7 @@ class Bouncy(Effect):
         self.id=c.BOUNCY
         self.name = "Bouncy Bullets"
         self.description = "When the collision code works correctly"
-        self.duration = 18
+        self.duration = owner.game.effect_durations[self.id]
         super().__init__(owner)
         self.icon = pygame.transform.scale2x(self.owner.game.get_static(c.image_path("bouncy_icon.png")))
 
@@ -175,6 +194,6 @@ class FastShooting(Effect):
         self.id=c.FAST_SHOOTING
         self.name = "Mandible Lubricant"
         self.description = "Improves regurigation efficiency by 80% or more"
-        self.duration = 25
+        self.duration = owner.game.effect_durations[self.id]
         super().__init__(owner)
         self.icon = pygame.transform.scale2x(self.owner.game.get_static(c.image_path("mandible_icon.png")))
@@ -0,0 +1,88 @@
+import pygame
+import constants as c
+import time
+from collections import deque
+
+TOGGLE_KEY = pygame.K_F3
+
+
+class FrameProfiler:
+    """ Times the phases of each frame and keeps the last few hundred frames
+    of every phase for percentiles.
+
+    Each mark(phase) charges the time since the previous mark to that phase,
+    so marks go at the end of the work they name. A phase marked more than
+    once in a frame, like the updates of several simulation steps, adds up.
+    While disabled, every call returns straight away. """
+
+    def __init__(self, history=240):
+        self.enabled = False
+        self.history = history
+        self.samples = {}
+        self.current = {}
+        self.last = 0
+        self.font = None
+
+    def toggle(self):
+        self.enabled = not self.enabled
+        self.samples = {}
+        self.current = {}
+        self.last = time.perf_counter()
+
+    def begin_frame(self):
+        if self.enabled:
+            self.last = time.perf_counter()
+
+    def mark(self, phase):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.current[phase] = self.current.get(phase, 0) + now - self.last
+        self.last = now
+
+    def end_frame(self):
+        if not self.enabled:
+            return
+        self.current["total"] = sum(self.current.values())
+        for phase, seconds in self.current.items():
+            if phase not in self.samples:
+                self.samples[phase] = deque(maxlen=self.history)
+            self.samples[phase].append(seconds)
+        self.current = {}
+
+    def stats(self, phase):
+        """ p50, p95, p99 and max of a phase over the kept frames, in seconds """
+        times = sorted(self.samples.get(phase, ()))
+        if not times:
+            return {"p50": 0, "p95": 0, "p99": 0, "max": 0}
+        pick = lambda p: times[min(int(p * len(times)), len(times) - 1)]
+        return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99), "max": times[-1]}
+
+    def draw(self, surface, counts, pos=(10, 10)):
+        """ Draws a bar per phase, with the p50 filled and the p95 outlined
+        against a 60 fps frame, and the given object counts below """
+        if not self.enabled:
+            return
+        if self.font is None:
+            self.font = pygame.font.Font(c.fonts_path("yoster.ttf"), 14)
+        row_height = 16
+        bar_width = 160
+        budget = 1/60
+        phases = list(self.samples)
+        x, y = pos
+        panel = pygame.Surface((bar_width + 440, row_height * (len(phases) + 2) + 8))
+        panel.set_alpha(180)
+        surface.blit(panel, (x - 4, y - 4))
+        for phase in phases:
+            stats = self.stats(phase)
+            label = self.font.render(phase, 0, (255, 255, 255))
+            surface.blit(label, (x, y))
+            bar_x = x + 130
+            pygame.draw.rect(surface, (80, 200, 120), (bar_x, y + 3, min(stats["p50"]/budget, 1) * bar_width, row_height - 6))
+            pygame.draw.rect(surface, (230, 200, 80), (bar_x, y + 3, min(stats["p95"]/budget, 1) * bar_width, row_height - 6), 1)
+            numbers = "  ".join(f"{key} {stats[key]*1000:.2f}" for key in ("p50", "p95", "p99", "max"))
+            surface.blit(self.font.render(numbers, 0, (200, 200, 200)), (bar_x + bar_width + 8, y))
+            y += row_height
+        y += row_height//2
+        line = "   ".join(f"{name} {count}" for name, count in counts.items())
+        surface.blit(self.font.render(line, 0, (255, 255, 255)), (x, y))
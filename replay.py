@@ -0,0 +1,189 @@
+""" Recording and replaying rounds. A replay holds the round's players, room
+and seed, the length of its steps and every key press and release, which
+is all it takes to simulate the round again exactly. Checksums of the
+simulation state taken while recording are checked during playback, so a
+replay that no longer plays back the same is caught at the step it goes
+wrong.
+
+    python replay.py replays/20261018-120000.json """
+
+import argparse
+import hashlib
+import json
+import os
+import struct
+import sys
+import time
+
+import pygame
+import constants as c
+
+
+class ReplayMismatch(Exception):
+    def __init__(self, step, expected, found):
+        super().__init__(f"replay diverged by step {step}: expected {expected}, got {found}")
+        self.step = step
+
+
+class Replay:
+    version = 1
+
+    def __init__(self, skins, keys, room_num, seed, dt=c.SIM_DT):
+        self.skins = list(skins)
+        self.keys = list(keys)
+        self.room_num = room_num
+        self.seed = seed
+        self.dt = dt
+        self.steps = 0
+        self.inputs = []  # [step, key, 1 for down or 0 for up]
+        self.dt_changes = []  # [step, dt] for steps whose dt isn't self.dt
+        self.checksums = []  # [step, digest after that step]
+        self.winners = None
+
+    def to_dict(self):
+        return {"version": self.version,
+                "skins": self.skins,
+                "keys": self.keys,
+                "room": self.room_num,
+                "seed": self.seed,
+                "dt": self.dt,
+                "steps": self.steps,
+                "inputs": self.inputs,
+                "dt_changes": self.dt_changes,
+                "checksums": self.checksums,
+                "winners": self.winners}
+
+    @classmethod
+    def from_dict(cls, data):
+        if data.get("version") != cls.version:
+            raise ValueError(f"unsupported replay version {data.get('version')}")
+        replay = cls(data["skins"], data["keys"], data["room"], data["seed"], data["dt"])
+        replay.steps = data["steps"]
+        replay.inputs = data["inputs"]
+        replay.dt_changes = data["dt_changes"]
+        replay.checksums = data["checksums"]
+        replay.winners = data["winners"]
+        return replay
+
+    def save(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, separators=(",", ":"))
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+
+def state_checksum(scene):
+    """ Digest of everything in the round that later steps depend on. Floats
+    are hashed by their exact bits, so any drift at all shows up. """
+    game = scene.game
+    digest = hashlib.sha1()
+    pack = lambda *values: digest.update(struct.pack(f"<{len(values)}d", *values))
+    for player in scene.players:
+        pack(player.x, player.y, player.angle, *player.velocity,
+             player.hp, player.dead, player.charged, player.charging)
+        digest.update(",".join(type(effect).__name__ for effect in player.effects).encode())
+    for bullet in game.bullets:
+        pack(bullet.x, bullet.y, *bullet.velocity)
+    for entity in game.entities:
+        pack(entity.x, entity.y, *entity.velocity)
+    for powerup in game.powerups:
+        pack(powerup.x, powerup.y, powerup.y_offset, powerup.landed)
+    for particles in (game.particles, game.top_particles):
+        digest.update(particles.data[:, :particles.count].tobytes())
+    digest.update(bytes(scene.room.flags))
+    return digest.hexdigest()[:16]
+
+
+class ReplayRecorder:
+    """ Records a RoomScene round as it is played. The scene calls record()
+    at the end of every step, and finish() once the round is over, which
+    saves the replay if it was given a path. """
+
+    def __init__(self, scene, path=None, checksum_every=c.SIM_FPS):
+        self.scene = scene
+        self.path = path
+        self.checksum_every = checksum_every
+        self.replay = Replay(scene.skin_list, scene.key_list, scene.room_num, scene.seed)
+
+    @staticmethod
+    def default_path():
+        return os.path.join(c.REPLAY_DIR, time.strftime("%Y%m%d-%H%M%S") + ".json")
+
+    def record(self, dt, events):
+        replay = self.replay
+        step = replay.steps
+        for event in events:
+            if event.type in (pygame.KEYDOWN, pygame.KEYUP) and event.key in replay.keys:
+                replay.inputs.append([step, event.key, int(event.type == pygame.KEYDOWN)])
+        if dt != replay.dt:
+            replay.dt_changes.append([step, dt])
+        replay.steps += 1
+        if replay.steps % self.checksum_every == 0:
+            replay.checksums.append([step, state_checksum(self.scene)])
+
+    def finish(self):
+        replay = self.replay
+        if not replay.checksums or replay.checksums[-1][0] != replay.steps - 1:
+            replay.checksums.append([replay.steps - 1, state_checksum(self.scene)])
+        replay.winners = [player.skin for player in self.scene.players if not player.dead]
+        if self.path is not None:
+            replay.save(self.path)
+        return replay
+
+
+def play(replay, game=None, verify=True):
+    """ Simulates a recorded round again, headless and as fast as the CPU
+    allows. Raises ReplayMismatch at the first checksum that differs. """
+    from headless import HeadlessMatch
+
+    match = HeadlessMatch(replay.skins, replay.keys, replay.room_num,
+                          dt=replay.dt, game=game, seed=replay.seed)
+    inputs = {}
+    for step, key, down in replay.inputs:
+        event_type = pygame.KEYDOWN if down else pygame.KEYUP
+        inputs.setdefault(step, []).append(pygame.event.Event(event_type, key=key))
+    dts = dict(replay.dt_changes)
+    checksums = dict(replay.checksums)
+
+    for step in range(replay.steps):
+        match.dt = dts.get(step, replay.dt)
+        match.step(inputs.get(step, []))
+        if verify and step in checksums:
+            found = state_checksum(match.scene)
+            if found != checksums[step]:
+                raise ReplayMismatch(step, checksums[step], found)
+    return match
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play back recorded rounds headlessly")
+    parser.add_argument("replays", nargs="+")
+    parser.add_argument("--no-verify", action="store_true", help="don't compare checksums")
+    args = parser.parse_args(argv)
+
+    from game import Game
+    game = Game(headless=True)
+    failed = False
+    for path in args.replays:
+        replay = Replay.load(path)
+        start = time.perf_counter()
+        try:
+            match = play(replay, game, verify=not args.no_verify)
+        except ReplayMismatch as e:
+            print(f"{path}: {e}", file=sys.stderr)
+            failed = True
+            continue
+        elapsed = time.perf_counter() - start
+        print(f"{path}: {replay.steps} steps in {elapsed:.2f}s "
+              f"({replay.steps * replay.dt / elapsed:.0f}x real time), winners {match.winners()}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,12 +1,156 @@
 import pygame
+import math
+import numpy as np
 import constants as c
-import random
+import json
+import os
+
+# Indices into TileAtlas.tiles
+BORDER_LEFT, BORDER_RIGHT, BORDER_BOTTOM, BORDER_TOP = 0, 1, 2, 3
+BORDER_IN_BL, BORDER_IN_TL, BORDER_IN_TR, BORDER_IN_BR = 4, 5, 6, 7
+BORDER_OUT_BL, BORDER_OUT_TL, BORDER_OUT_TR, BORDER_OUT_BR = 8, 9, 10, 11
+SOLID_WALL = 12
+PLAIN_WALL = 13
+GRASS = 14
+BREAKABLE = 15
+BLANK = 16
+DOOR_OPEN = 17
+
+# Indices into TileAtlas.shadows
+SQUARE_SHADOW = 0
+SHADOW_OUT_BL, SHADOW_OUT_TL, SHADOW_OUT_TR, SHADOW_OUT_BR = 1, 2, 3, 4
+
+# Bits of Room.flags
+BLOCKING = 1
+BREAKABLE_FLAG = 2
+
+# Neighbor cells as (dx, dy), in the bit order of an autotile mask
+NEIGHBOR_OFFSETS = [(-1, -1), (0, -1), (1, -1),
+                    (-1, 0), (1, 0),
+                    (-1, 1), (0, 1), (1, 1)]
+
+
+def four_edges(neighbors):
+    if neighbors[0][1] == "X" and neighbors[1][0] == "X" and neighbors[1][2] == "X" and neighbors[2][1] == "X":
+        return True
+
+def only_edges(neighbors):
+    return [item=="X" for item in (neighbors[0][1], neighbors[1][0], neighbors[2][1], neighbors[1][2])]
+
+def autotile(mask):
+    """ Picks the (tile, shadow) atlas indices for a wall from a bitmask of
+    which of its eight neighbors are also walls """
+    neighbors = [["X", "X", "X"] for _ in range(3)]
+    for bit, (dx, dy) in enumerate(NEIGHBOR_OFFSETS):
+        if not mask & (1 << bit):
+            neighbors[dy+1][dx+1] = "."
+
+    if neighbors[1][0] == "X" and neighbors[0][1] == "X" and neighbors[2][1] == "X" and neighbors[1][2] != "X":
+        return BORDER_LEFT, SQUARE_SHADOW
+    elif neighbors[1][2] == "X" and neighbors[0][1] == "X" and neighbors[2][1] == "X" and neighbors[1][0] != "X":
+        return BORDER_RIGHT, SQUARE_SHADOW
+    elif neighbors[1][0] == "X" and neighbors[0][1] == "X" and neighbors[1][2] == "X" and neighbors[2][1] != "X":
+        return BORDER_TOP, SQUARE_SHADOW
+    elif neighbors[2][1] == "X" and neighbors[1][0] == "X" and neighbors[1][2] == "X" and neighbors[0][1] != "X":
+        return BORDER_BOTTOM, SQUARE_SHADOW
+    elif all([all([item=="X" for item in row]) for row in neighbors]):
+        return SOLID_WALL, SQUARE_SHADOW
+    elif four_edges(neighbors) and neighbors[0][2] != "X":
+        return BORDER_IN_BL, SQUARE_SHADOW
+    elif four_edges(neighbors) and neighbors[2][2] != "X":
+        return BORDER_IN_TL, SQUARE_SHADOW
+    elif four_edges(neighbors) and neighbors[2][0] != "X":
+        return BORDER_IN_TR, SQUARE_SHADOW
+    elif four_edges(neighbors) and neighbors[0][0] != "X":
+        return BORDER_IN_BR, SQUARE_SHADOW
+    elif only_edges(neighbors) == [1, 0, 0, 1]:
+        return BORDER_OUT_BL, SHADOW_OUT_BL
+    elif only_edges(neighbors) == [0, 0, 1, 1]:
+        return BORDER_OUT_TL, SHADOW_OUT_TL
+    elif only_edges(neighbors) == [0, 1, 1, 0]:
+        return BORDER_OUT_TR, SHADOW_OUT_TR
+    elif only_edges(neighbors) == [1, 1, 0, 0]:
+        return BORDER_OUT_BR, SHADOW_OUT_BR
+    else:
+        return PLAIN_WALL, SQUARE_SHADOW
+
+AUTOTILE_TABLE = [autotile(mask) for mask in range(256)]
+
+
+BORDER_IMAGES = ["border_left.png",
+                 "border_right.png",
+                 "border_bottom.png",
+                 "border_top.png",
+                 "border_in_bl.png",
+                 "border_in_tl.png",
+                 "border_in_tr.png",
+                 "border_in_br.png",
+                 "border_out_bl.png",
+                 "border_out_tl.png",
+                 "border_out_tr.png",
+                 "border_out_br.png"]
+
+
+class TileAtlas:
+    """ Every tile and shadow image, scaled up once and shared by all rooms """
+
+    def __init__(self, game):
+        self.tiles = []
+        for item in BORDER_IMAGES:
+            self.tiles.append(pygame.transform.scale2x(game.get_static(c.image_path(item), "tiles")))
+        self.tiles.append(self.solid((0, 0, 0)))
+        self.tiles.append(self.solid((50, 50, 50)))
+        self.tiles.append(pygame.transform.scale2x(game.get_static(c.image_path("grass.png"), "tiles")))
+        self.tiles.append(pygame.transform.scale2x(game.get_static(c.image_path("breakable.png"), "tiles")))
+        self.tiles.append(self.solid((200, 200, 200)))
+        self.tiles.append(self.solid((180, 190, 220)))
+
+        self.shadows = [self.shadow(None),
+                        self.shadow((0, 1)),
+                        self.shadow((0, 0)),
+                        self.shadow((1, 0)),
+                        self.shadow((1, 1))]
+
+        for tile in self.tiles:
+            game.assets.track(tile, "tiles")
+        for shadow in self.shadows:
+            game.assets.rle(shadow, "tiles")
+
+    def solid(self, color):
+        surface = pygame.Surface((c.TILE_SIZE, c.TILE_SIZE))
+        surface.fill(color)
+        return surface
+
+    def shadow(self, corner):
+        """ A translucent square, or with corner given, a square rounded off
+        on the far side from that corner """
+        black = self.solid((0, 0, 0))
+        shadow = black.copy()
+        shadow.set_alpha(40)
+        shadow.set_colorkey((255, 255, 255))
+        if corner is None:
+            return shadow
+
+        shadow.fill((255, 255, 255))
+        corner = [1 - c for c in corner]
+        cx = shadow.get_width()//2
+        cy = shadow.get_height()//2
+        pygame.draw.circle(shadow, (0, 0, 0), (cx, cy), shadow.get_width()//2)
+        if corner[0]:
+            shadow.blit(black, (cx, 0))
+        else:
+            shadow.blit(black, (-cx, 0))
+        if corner[1]:
+            shadow.blit(black, (0, cy))
+        else:
+            shadow.blit(black, (0, -cy))
+        return shadow
+
 
 class Tile:
     def __init__(self, game, room, coords):
         self.game = game
-        self.surface = pygame.Surface((c.TILE_SIZE, c.TILE_SIZE))
-        self.surface.fill((200, 200, 200))
+        self.tile_index = BLANK
         self.room = room
 
         self.layer = 0
@@ -19,6 +163,10 @@ class Tile:
         self.x = (c.WINDOW_WIDTH - c.TILE_SIZE*(room.width-1))//2 + c.TILE_SIZE * coords[0]
         self.y = (c.WINDOW_HEIGHT - c.TILE_SIZE*(room.height-1))//2 + c.TILE_SIZE * coords[1]
 
+    @property
+    def surface(self):
+        return self.room.atlas.tiles[self.tile_index]
+
     def update(self, dt, events):
         pass
 
@@ -30,119 +178,27 @@ class Tile:
 class EmptyTile(Tile):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.surface = self.game.get_static(c.image_path("grass.png"))
-        self.surface = pygame.transform.scale2x(self.surface)
+        self.tile_index = GRASS
 
 class BlockingTile(Tile):
     def __init__(self, game, room, coords):
         super().__init__(game, room, coords)
-        self.surfaces = {}
-        for i, item in enumerate(["border_left.png",
-                                  "border_right.png",
-                                  "border_bottom.png",
-                                  "border_top.png",
-                                  "border_in_bl.png",
-                                  "border_in_tl.png",
-                                  "border_in_tr.png",
-                                  "border_in_br.png",
-                                  "border_out_bl.png",
-                                  "border_out_tl.png",
-                                  "border_out_tr.png",
-                                  "border_out_br.png"]):
-            self.surfaces[i] = pygame.transform.scale2x(self.game.get_static(c.image_path(item)))
-        self.surface = pygame.transform.scale2x(self.surface)
+        self.tile_index = PLAIN_WALL # replaced from RoomTemplate.walls
+        self.shadow_index = SQUARE_SHADOW
         self.blocking = True
         self.layer = 2
-        self.black = pygame.Surface((c.TILE_SIZE, c.TILE_SIZE))
-        self.black.fill((0, 0, 0))
-        self.black_t = self.black.copy()
-        self.black_t.set_alpha(40)
-        self.black_t.set_colorkey((255, 255, 255))
-        self.has_neighbored = False
-
-    def set_black_t_corner(self, corner = (0, 0)):
-        self.black_t.fill((255, 255, 255))
-        corner = [1 - c for c in corner]
-        cx = self.black_t.get_width()//2
-        cy = self.black_t.get_height()//2
-        pygame.draw.circle(self.black_t, (0, 0, 0), (cx, cy), self.black_t.get_width()//2)
-        if corner[0]:
-            self.black_t.blit(self.black, (cx, 0))
-        else:
-            self.black_t.blit(self.black, (-cx, 0))
-        if corner[1]:
-            self.black_t.blit(self.black, (0, cy))
-        else:
-            self.black_t.blit(self.black, (0, -cy))
 
     def draw(self, surface, offset=(0, 0)):
-        old_surf = self.surface
-        if not self.has_neighbored:
-            self.has_neighbored = True
-            neighbors = self.room.neighbors(self.x_coord, self.y_coord)
-            if neighbors[1][0] == "X" and neighbors[0][1] == "X" and neighbors[2][1] == "X" and neighbors[1][2] != "X":
-                self.surface = self.surfaces[0]
-            elif neighbors[1][2] == "X" and neighbors[0][1] == "X" and neighbors[2][1] == "X" and neighbors[1][0] != "X":
-                self.surface = self.surfaces[1]
-            elif neighbors[1][0] == "X" and neighbors[0][1] == "X" and neighbors[1][2] == "X" and neighbors[2][1] != "X":
-                self.surface = self.surfaces[3]
-            elif neighbors[2][1] == "X" and neighbors[1][0] == "X" and neighbors[1][2] == "X" and neighbors[0][1] != "X":
-                self.surface = self.surfaces[2]
-            elif all([all([item=="X" for item in row]) for row in neighbors]):
-                self.surface = self.black
-            elif self.four_edges(neighbors) and neighbors[0][2] != "X":
-                self.surface = self.surfaces[4]
-            elif self.four_edges(neighbors) and neighbors[2][2] != "X":
-                self.surface = self.surfaces[5]
-            elif self.four_edges(neighbors) and neighbors[2][0] != "X":
-                self.surface = self.surfaces[6]
-            elif self.four_edges(neighbors) and neighbors[0][0] != "X":
-                self.surface = self.surfaces[7]
-            elif self.only_edges(neighbors) == [1, 0, 0, 1]:
-                self.surface = self.surfaces[8]
-                if self.surface != old_surf:
-                    self.set_black_t_corner((0, 1))
-            elif self.only_edges(neighbors) == [0, 0, 1, 1]:
-                self.surface = self.surfaces[9]
-                if self.surface != old_surf:
-                    self.set_black_t_corner((0, 0))
-            elif self.only_edges(neighbors) == [0, 1, 1, 0]:
-                self.surface = self.surfaces[10]
-                if self.surface != old_surf:
-                    self.set_black_t_corner((1, 0))
-            elif self.only_edges(neighbors) == [1, 1, 0, 0]:
-                self.surface = self.surfaces[11]
-                if self.surface != old_surf:
-                    self.set_black_t_corner((1, 1))
-            else:
-                self.surface = pygame.Surface((c.TILE_SIZE,c.TILE_SIZE))
-                self.surface.fill((50, 50, 50))
-
         x = self.x - c.TILE_SIZE//2 + offset[0] + 12
         y = self.y - c.TILE_SIZE//2 + offset[1] + 20
-        if not hasattr(self, "broken"):
-            surface.blit(self.black_t, (x, y))
+        surface.blit(self.room.atlas.shadows[self.shadow_index], (x, y))
         super().draw(surface, offset=offset)
 
-    def four_edges(self, neighbors):
-        if neighbors[0][1] == "X" and neighbors[1][0] == "X" and neighbors[1][2] == "X" and neighbors[2][1] == "X":
-            return True
-
-    def only_edges(self, neighbors):
-        return [item=="X" for item in (neighbors[0][1], neighbors[1][0], neighbors[2][1], neighbors[1][2])]
-
 class BreakableTile(BlockingTile):
     def __init__(self, *args, **kwargs):
         super().__init__(*args,**kwargs)
-        self.surface = self.game.get_static(c.image_path("breakable.png"))
-        self.surface = pygame.transform.scale2x(self.surface)
-        self.has_neighbored = True
+        self.tile_index = BREAKABLE
         self.broken = False
-        self.black = pygame.Surface((c.TILE_SIZE, c.TILE_SIZE))
-        self.black.fill((0, 0, 0))
-        self.black_t = self.black.copy()
-        self.black_t.set_alpha(40)
-        self.black_t.set_colorkey((255, 255, 255))
 
     def break_me(self):
         self.broken = True
@@ -154,57 +210,190 @@ class BreakableTile(BlockingTile):
         else:
             x = self.x - c.TILE_SIZE//2 + offset[0] + 6
             y = self.y - c.TILE_SIZE//2 + offset[1] + 10
-            surface.blit(self.black_t, (x, y))
-            super().draw(surface, offset=offset)
+            surface.blit(self.room.atlas.shadows[self.shadow_index], (x, y))
+            Tile.draw(self, surface, offset=offset)
 
 class Door(BlockingTile):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.open_surface = pygame.Surface((c.TILE_SIZE, c.TILE_SIZE))
-        self.open_surface.fill((180, 190, 220))
+        self.open_index = DOOR_OPEN
 
     def draw(self, surface, offset=(0, 0)):
         if self.blocking:
             super().draw(surface, offset=offset)
         else:
-            self.surface, self.open_surface = self.open_surface, self.surface
+            self.tile_index, self.open_index = self.open_index, self.tile_index
             super().draw(surface, offset=offset)
-            self.surface, self.open_surface = self.open_surface, self.surface
+            self.tile_index, self.open_index = self.open_index, self.tile_index
 
     def lock(self):
         self.blocking = True
+        self.room.refresh_cell(self.x_coord, self.y_coord)
+        self.room.invalidate_cell(self.x_coord, self.y_coord)
 
     def unlock(self):
         self.blocking = False
+        self.room.refresh_cell(self.x_coord, self.y_coord)
+        self.room.invalidate_cell(self.x_coord, self.y_coord)
+
+#   Room templates parsed so far, keyed by path
+_template_cache = {}
+
+
+class RoomTemplate:
+    """ Everything about a room file that doesn't change during play: the
+    grid, spawn cells and the autotiled image of every wall. Rooms are built
+    from templates, and templates are cached in memory and optionally on
+    disk, both invalidated when the room file's mtime changes. """
+
+    version = 1
+
+    def __init__(self, lines, mtime):
+        self.lines = lines
+        self.mtime = mtime
+        self.width = len(lines[0].strip())
+        self.height = len(lines)
+        self.spawns = {}
+        self.powerup_spawns = []
+        self.breakables = []
+        self.walls = {}
+        for y, line in enumerate(lines):
+            for x, char in enumerate(line):
+                if char in ["1", "2", "3", "4"]:
+                    self.spawns[int(char)] = (x, y)
+                if char in ["P"]:
+                    self.powerup_spawns.append((x, y))
+                if char in ["B"]:
+                    self.breakables.append((x, y))
+                if char == "X":
+                    self.walls[(x, y)] = AUTOTILE_TABLE[self.neighbor_mask(x, y)]
+
+    @staticmethod
+    def load(path):
+        mtime = os.path.getmtime(path)
+        template = _template_cache.get(path)
+        if template is not None and template.mtime == mtime:
+            return template
+        template = RoomTemplate.read_compiled(path, mtime)
+        if template is None:
+            with open(path, "r") as f:
+                template = RoomTemplate([line.replace("D","X") for line in f.readlines()], mtime)
+            template.write_compiled(path)
+        _template_cache[path] = template
+        return template
+
+    @staticmethod
+    def compiled_path(path):
+        return os.path.join(c.ROOM_CACHE_DIR, os.path.basename(path) + ".json")
+
+    @staticmethod
+    def read_compiled(path, mtime):
+        if not c.ROOM_CACHE_ON_DISK:
+            return None
+        try:
+            with open(RoomTemplate.compiled_path(path), "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get("version") != RoomTemplate.version or data.get("mtime") != mtime:
+            return None
+        template = RoomTemplate.__new__(RoomTemplate)
+        template.lines = data["lines"]
+        template.mtime = mtime
+        template.width, template.height = data["width"], data["height"]
+        template.spawns = {int(num): tuple(cell) for num, cell in data["spawns"].items()}
+        template.powerup_spawns = [tuple(cell) for cell in data["powerup_spawns"]]
+        template.breakables = [tuple(cell) for cell in data["breakables"]]
+        template.walls = {(x, y): (tile, shadow) for x, y, tile, shadow in data["walls"]}
+        return template
+
+    def write_compiled(self, path):
+        if not c.ROOM_CACHE_ON_DISK:
+            return
+        data = {"version": self.version,
+                "mtime": self.mtime,
+                "lines": self.lines,
+                "width": self.width,
+                "height": self.height,
+                "spawns": self.spawns,
+                "powerup_spawns": self.powerup_spawns,
+                "breakables": self.breakables,
+                "walls": [[x, y, tile, shadow] for (x, y), (tile, shadow) in self.walls.items()]}
+        try:
+            os.makedirs(c.ROOM_CACHE_DIR, exist_ok=True)
+            with open(self.compiled_path(path), "w") as f:
+                json.dump(data, f)
+        except OSError:
+            pass
+
+    def is_wall(self, x, y):
+        if x < 0 or y < 0 or x >= self.width or y >= self.height:
+            return True
+        return self.lines[y][x] == "X"
+
+    def neighbor_mask(self, x, y):
+        mask = 0
+        for bit, (dx, dy) in enumerate(NEIGHBOR_OFFSETS):
+            if self.is_wall(x + dx, y + dy):
+                mask |= 1 << bit
+        return mask
+
 
 class Room:
     @staticmethod
     def from_file(game, path):
-        with open(path, "r") as f:
-            lines = [line.replace("D","X") for line in f.readlines()]
-        width = len(lines[0].strip())
-        height = len(lines)
+        return Room.from_template(game, RoomTemplate.load(path))
+
+    @staticmethod
+    def load(game, path):
+        """ Like from_file, but each game keeps the rooms it has built and
+        only resets one when it is played again """
+        template = RoomTemplate.load(path)
+        room = game.room_cache.get(path)
+        if room is not None and room.template is template:
+            room.reset()
+            return room
+        room = Room.from_template(game, template)
+        game.room_cache[path] = room
+        return room
+
+    @staticmethod
+    def from_template(game, template):
+        width, height = template.width, template.height
         room = Room(game, width, height, randomize=False)
-        room.lines = lines
-        room.width, room.height = width, height
-        for y, line in enumerate(lines):
+        room.template = template
+        room.lines = template.lines
+        for y, line in enumerate(template.lines):
             for x, char in enumerate(line):
                 if char == "X" or char=="D":
-                    room.objects[y][x].append(BlockingTile(game, room, (x, y)))
+                    wall = BlockingTile(game, room, (x, y))
+                    wall.tile_index, wall.shadow_index = template.walls[(x, y)]
+                    room.objects[y][x].append(wall)
                 if char in [".", "X", "D", "1", "2", "3", "4", "P","B"]:
                     room.objects[y][x].append(EmptyTile(game, room, (x, y)))
-                    if char in ["1", "2", "3", "4"]:
-                        room.spawns[int(char)] = room.cell_to_world(x, y)
-                    if char in ["P"]:
-                        room.powerup_spawns.append(room.cell_to_world(x, y))
                     if char in ["B"]:
-                        room.objects[y][x].append(BreakableTile(game, room, (x, y)))
+                        breakable = BreakableTile(game, room, (x, y))
+                        room.objects[y][x].append(breakable)
+                        room.breakables.append(breakable)
                 # if char == "D":
                 #     door = Door(game, room, (x, y))
                 #     room.objects[y][x].append(door)
                 #     room.doors.append(door)
+        room.spawns = {num: room.cell_to_world(*cell) for num, cell in template.spawns.items()}
+        room.powerup_spawns = [room.cell_to_world(*cell) for cell in template.powerup_spawns]
+        room.refresh_flags()
         return room
 
+    def reset(self):
+        """ Puts back every breakable tile broken in an earlier round """
+        for tile in self.breakables:
+            if tile.broken:
+                tile.broken = False
+                tile.blocking = True
+                self.refresh_cell(tile.x_coord, tile.y_coord)
+                self.invalidate_cell(tile.x_coord, tile.y_coord)
+        self.changed_rects = []
+
     def get_rect(self):
         w = self.width * c.TILE_SIZE
         h = self.height * c.TILE_SIZE
@@ -216,6 +405,8 @@ class Room:
         for tile in tiles:
             if type(tile) == BreakableTile:
                 tile.break_me()
+                self.refresh_cell(x, y)
+                self.invalidate_cell(x, y)
                 return True
         return False
 
@@ -241,12 +432,48 @@ class Room:
         self.width = width
         self.height = height
         self.doors = []
+        self.breakables = []
+        self.template = None
         self.powerup_spawns = []
         self.spawns = {}
+        self.baked_layers = {}
+        # Screen rects of re-rendered cells, kept only while a dirty-rect
+        # renderer is there to use them
+        self.track_changes = False
+        self.changed_rects = []
+        self.atlas = game.get_tile_atlas()
+
+        # World position of cell (0, 0) as world_to_cell and cell_to_world see it
+        self.world_origin = (c.WINDOW_WIDTH//2 - (width-1)/2 * c.TILE_SIZE,
+                             c.WINDOW_HEIGHT//2 - (height-1)/2 * c.TILE_SIZE)
+        self.cell_origin = ((c.WINDOW_WIDTH - c.TILE_SIZE*(width-1))//2,
+                            (c.WINDOW_HEIGHT - c.TILE_SIZE*(height-1))//2)
+
+        # One byte of BLOCKING/BREAKABLE_FLAG bits per cell, row-major, with a
+        # NumPy view of the same memory for batched lookups
+        self.flags = bytearray(width * height)
+        self.flag_grid = np.frombuffer(self.flags, dtype=np.uint8).reshape(height, width)
+
         if randomize:
             self.objects = [[[self.random_tile(x, y)] for x in range(width)] for y in range(height)]
         else:
             self.objects = [[[] for x in range(width)] for y in range(height)]
+        self.refresh_flags()
+
+    def refresh_cell(self, x, y):
+        """ Recomputes the flags of one cell from the tiles in it """
+        flags = 0
+        for item in self.objects[y][x]:
+            if item.blocking:
+                flags |= BLOCKING
+                if type(item) == BreakableTile:
+                    flags |= BREAKABLE_FLAG
+        self.flags[y*self.width + x] = flags
+
+    def refresh_flags(self):
+        for y in range(self.height):
+            for x in range(self.width):
+                self.refresh_cell(x, y)
 
     def some_doors_are_locked(self):
         return any([door.blocking for door in self.doors])
@@ -260,7 +487,7 @@ class Room:
             door.unlock()
 
     def random_tile(self, x, y):
-        if random.random() < 0.1:
+        if self.game.rng.random() < 0.1:
             return BlockingTile(self.game, self, (x, y))
         else:
             return EmptyTile(self.game, self, (x, y))
@@ -286,14 +513,54 @@ class Room:
         if not self.game.entities and self.some_doors_are_locked():
             self.unlock_doors()
 
-    def draw(self, surface, offset=(0, 0), layer=None):
+    def layers(self):
+        return sorted({item.layer for item in self.item_iter()})
+
+    def bake_layer(self, layer):
+        """ Renders every tile of a layer into one window-sized surface """
+        baked = self.game.assets.track(pygame.Surface(c.WINDOW_SIZE, pygame.SRCALPHA), "rooms")
         for item in self.item_iter():
-            if item.layer == layer or layer is None:
-                item.draw(surface, offset=offset)
+            if item.layer == layer:
+                item.draw(baked)
+        self.baked_layers[layer] = baked
+        return baked
+
+    def invalidate_cell(self, x, y):
+        """ Re-renders the part of each baked layer that the tile at (x, y)
+        covers, including the shadow it casts down and to the right """
+        if not self.baked_layers:
+            return
+        left, top = self.cell_to_world(x - 0.5, y - 0.5)
+        shadow = c.TILE_SIZE//2
+        rect = pygame.Rect(left, top, c.TILE_SIZE + shadow, c.TILE_SIZE + shadow)
+        if self.track_changes:
+            self.changed_rects.append(rect)
+        nearby = [item for y0 in range(max(y-1, 0), min(y+2, self.height))
+                  for x0 in range(max(x-1, 0), min(x+2, self.width))
+                  for item in self.objects[y0][x0]]
+        for layer, baked in self.baked_layers.items():
+            baked.set_clip(rect)
+            baked.fill((0, 0, 0, 0))
+            for item in nearby:
+                if item.layer == layer:
+                    item.draw(baked)
+            baked.set_clip(None)
+
+    def draw(self, surface, offset=(0, 0), layer=None, area=None):
+        """ Draws the baked layers, or only the part of them inside area """
+        layers = [layer] if layer is not None else self.layers()
+        for layer in layers:
+            baked = self.baked_layers.get(layer)
+            if baked is None:
+                baked = self.bake_layer(layer)
+            if area is None:
+                surface.blit(baked, offset)
+            else:
+                surface.blit(baked, (area[0] + offset[0], area[1] + offset[1]), area)
 
     def world_to_cell(self, x, y, discrete=False):
-        x -= c.WINDOW_WIDTH//2 - (self.width-1)/2 * c.TILE_SIZE
-        y -= c.WINDOW_HEIGHT//2 - (self.height-1)/2 * c.TILE_SIZE
+        x -= self.world_origin[0]
+        y -= self.world_origin[1]
         x /= c.TILE_SIZE
         y /= c.TILE_SIZE
         if discrete:
@@ -302,8 +569,8 @@ class Room:
         return (x, y)
 
     def cell_to_world(self, x, y):
-        x = (c.WINDOW_WIDTH - c.TILE_SIZE*(self.width-1))//2 + c.TILE_SIZE * x
-        y = (c.WINDOW_HEIGHT - c.TILE_SIZE*(self.height-1))//2 + c.TILE_SIZE * y
+        x = self.cell_origin[0] + c.TILE_SIZE * x
+        y = self.cell_origin[1] + c.TILE_SIZE * y
         return x, y
 
     def cell_is_blocking(self, x, y):
@@ -311,8 +578,75 @@ class Room:
             return False
         if y < 0 or y >= self.height:
             return False
-        cell = self.objects[y][x]
-        for item in cell:
-            if item.blocking:
-                return True
-        return False
+        return self.flags[y*self.width + x] & BLOCKING != 0
+
+    def blocking_neighbors(self, x0, y0):
+        """ Blocking cells in the 3x3 block around (x0, y0), column by column """
+        cells = []
+        flags = self.flags
+        width = self.width
+        for x in (x0 - 1, x0, x0 + 1):
+            if x < 0 or x >= width:
+                continue
+            for y in (y0 - 1, y0, y0 + 1):
+                if 0 <= y < self.height and flags[y*width + x] & BLOCKING:
+                    cells.append((x, y))
+        return cells
+
+    def first_blocking_cell(self, x0, y0, x1, y1):
+        """ Walks the cells a segment crosses in order and returns the first
+        blocking one as (cell_x, cell_y, t), where t is the fraction of the
+        segment covered on entering it, or None if the path is clear """
+        u0 = (x0 - self.world_origin[0]) / c.TILE_SIZE + 0.5
+        v0 = (y0 - self.world_origin[1]) / c.TILE_SIZE + 0.5
+        du = (x1 - self.world_origin[0]) / c.TILE_SIZE + 0.5 - u0
+        dv = (y1 - self.world_origin[1]) / c.TILE_SIZE + 0.5 - v0
+        x, y = math.floor(u0), math.floor(v0)
+        crossings = abs(math.floor(u0 + du) - x) + abs(math.floor(v0 + dv) - y)
+
+        step_x = 1 if du > 0 else -1
+        step_y = 1 if dv > 0 else -1
+        # t at which the segment crosses the next vertical and horizontal cell edge
+        next_x = ((x + 1 - u0) if du > 0 else (u0 - x)) / abs(du) if du else math.inf
+        next_y = ((y + 1 - v0) if dv > 0 else (v0 - y)) / abs(dv) if dv else math.inf
+        t = 0
+        for _ in range(crossings + 1):
+            if self.cell_is_blocking(x, y):
+                return x, y, t
+            if next_x < next_y:
+                x += step_x
+                t = next_x
+                next_x += 1/abs(du)
+            else:
+                y += step_y
+                t = next_y
+                next_y += 1/abs(dv)
+        return None
+
+    def cells_at(self, xs, ys):
+        """ Discrete cell coordinates of many world positions at once, rounded
+        the same way as world_to_cell """
+        cell_xs = np.trunc((np.asarray(xs) - self.world_origin[0]) / c.TILE_SIZE + 0.5).astype(int)
+        cell_ys = np.trunc((np.asarray(ys) - self.world_origin[1]) / c.TILE_SIZE + 0.5).astype(int)
+        return cell_xs, cell_ys
+
+    def flags_at_cells(self, cell_xs, cell_ys):
+        """ Flags of many cells at once, with 0 for cells outside the room """
+        inside = (cell_xs >= 0) & (cell_xs < self.width) & (cell_ys >= 0) & (cell_ys < self.height)
+        flags = np.zeros(len(cell_xs), dtype=np.uint8)
+        flags[inside] = self.flag_grid[cell_ys[inside], cell_xs[inside]]
+        return flags
+
+    def blocking_at(self, xs, ys):
+        """ Whether each of many world positions is inside a blocking cell """
+        return self.flags_at_cells(*self.cells_at(xs, ys)) & BLOCKING != 0
+
+    def near_blocking_at(self, xs, ys):
+        """ Whether each of many world positions has a blocking cell anywhere
+        in the 3x3 block around it """
+        cell_xs, cell_ys = self.cells_at(xs, ys)
+        near = np.zeros(len(cell_xs), dtype=bool)
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                near |= self.flags_at_cells(cell_xs + dx, cell_ys + dy) & BLOCKING != 0
+        return near
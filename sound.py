@@ -0,0 +1,91 @@
+import math
+import pygame
+import constants as c
+
+
+class SoundEffect:
+    """ Handle for one sound effect. play() asks the manager to play it at
+    the end of the frame rather than playing it straight away. """
+
+    def __init__(self, manager, sound, volume, priority=1, min_interval=0):
+        self.manager = manager
+        self.sound = sound
+        self.volume = volume
+        self.priority = priority
+        self.min_interval = min_interval
+        self.last_played = -math.inf
+
+    def play(self):
+        self.manager.request(self)
+
+
+class SoundManager:
+    """ Plays every sound effect through a fixed pool of mixer channels.
+
+    Requests are collected over a frame and flushed together. Several
+    requests for one effect in a frame play once, louder, and an effect
+    doesn't play again until min_interval seconds after it last did. When
+    every channel is busy, the voice with the lowest priority, oldest first,
+    is cut off for a sound of at least its priority. Disabled, it plays
+    nothing, for running without audio. """
+
+    def __init__(self, channels=c.SOUND_CHANNELS, enabled=True, max_burst_gain=2):
+        self.enabled = enabled
+        self.max_burst_gain = max_burst_gain
+        self.time = 0
+        self.requests = {}
+        self.channels = []
+        if enabled:
+            pygame.mixer.set_num_channels(channels)
+            pygame.mixer.set_reserved(channels)
+            self.channels = [pygame.mixer.Channel(i) for i in range(channels)]
+        # (effect, start time) of what each channel last played
+        self.voices = [None for _ in self.channels]
+        self.stats = {"played": 0, "merged": 0, "limited": 0, "stolen": 0, "dropped": 0}
+
+    def effect(self, sound, volume, priority=1, min_interval=0):
+        return SoundEffect(self, sound, volume, priority, min_interval)
+
+    def request(self, effect):
+        if self.enabled:
+            self.requests[effect] = self.requests.get(effect, 0) + 1
+
+    def flush(self, dt):
+        """ Plays this frame's requests, most important first """
+        self.time += dt
+        requests = sorted(self.requests.items(), key=lambda item: -item[0].priority)
+        self.requests = {}
+        for effect, count in requests:
+            self.stats["merged"] += count - 1
+            if self.time - effect.last_played < effect.min_interval:
+                self.stats["limited"] += 1
+                continue
+            idx = self.free_channel(effect.priority)
+            if idx is None:
+                self.stats["dropped"] += 1
+                continue
+            # Sounds that play together add up in power, not amplitude
+            gain = min(math.sqrt(count), self.max_burst_gain)
+            channel = self.channels[idx]
+            channel.play(effect.sound)
+            channel.set_volume(min(effect.volume * gain, 1))
+            self.voices[idx] = (effect, self.time)
+            effect.last_played = self.time
+            self.stats["played"] += 1
+
+    def free_channel(self, priority):
+        """ Index of an idle channel, or of the voice to cut off for a sound
+        of the given priority, or None if everything playing matters more """
+        victim = None
+        for idx, channel in enumerate(self.channels):
+            if not channel.get_busy():
+                return idx
+            effect, started = self.voices[idx]
+            if effect.priority > priority:
+                continue
+            if victim is None or (effect.priority, started) < (self.voices[victim][0].priority, self.voices[victim][1]):
+                victim = idx
+        if victim is not None:
+            self.channels[victim].stop()
+            self.stats["stolen"] += 1
+        return victim
@@ -0,0 +1,90 @@
+import math
+import constants as c
+
+
+def contact_time(item, target):
+    """ Fraction of the step at which a circle moving in a straight line from
+    (prev_x, prev_y) to (x, y) first touches a still target circle, or None
+    if it misses """
+    sx = item.prev_x - target.x
+    sy = item.prev_y - target.y
+    dx = item.x - item.prev_x
+    dy = item.y - item.prev_y
+    reach = item.radius + target.radius
+    start = sx*sx + sy*sy - reach*reach
+    if start < 0:
+        return 0
+    length = dx*dx + dy*dy
+    along = sx*dx + sy*dy
+    if along >= 0 or length == 0:
+        return None
+    disc = along*along - length*start
+    if disc < 0:
+        return None
+    t = (-along - math.sqrt(disc))/length
+    return t if t <= 1 else None
+
+
+class SpatialHash:
+    """ Uniform grid that buckets moving circles (anything with x, y, prev_x,
+    prev_y and radius) by every cell the bounding box of their path this step
+    touches, so overlap queries only look at nearby items. """
+
+    def __init__(self, cell_size=c.TILE_SIZE):
+        self.cell_size = cell_size
+        self.cells = {}
+
+    def clear(self):
+        self.cells = {}
+
+    def cell_range(self, x, y, radius):
+        size = self.cell_size
+        return (int((x - radius)//size), int((x + radius)//size),
+                int((y - radius)//size), int((y + radius)//size))
+
+    def swept_range(self, item):
+        x0, x1, y0, y1 = self.cell_range(item.x, item.y, item.radius)
+        px0, px1, py0, py1 = self.cell_range(item.prev_x, item.prev_y, item.radius)
+        return min(x0, px0), max(x1, px1), min(y0, py0), max(y1, py1)
+
+    def insert(self, item):
+        x0, x1, y0, y1 = self.swept_range(item)
+        for cell_x in range(x0, x1 + 1):
+            for cell_y in range(y0, y1 + 1):
+                key = (cell_x, cell_y)
+                if key in self.cells:
+                    self.cells[key].append(item)
+                else:
+                    self.cells[key] = [item]
+
+    def rebuild(self, items):
+        self.clear()
+        for item in items:
+            self.insert(item)
+
+    def query(self, x, y, radius):
+        """ Every item sharing a cell with the circle's bounding box, once
+        each and in a stable order """
+        found = []
+        seen = set()
+        x0, x1, y0, y1 = self.cell_range(x, y, radius)
+        for cell_x in range(x0, x1 + 1):
+            for cell_y in range(y0, y1 + 1):
+                for item in self.cells.get((cell_x, cell_y), ()):
+                    if id(item) not in seen:
+                        seen.add(id(item))
+                        found.append(item)
+        return found
+
+    def contacts(self, targets):
+        """ (target, item) pairs where an item's path this step touches a
+        target's circle, in the order the items reach them. Targets are taken
+        to stand still, since they move after the items. """
+        hits = []
+        for target in targets:
+            for item in self.query(target.x, target.y, target.radius):
+                t = contact_time(item, target)
+                if t is not None:
+                    hits.append((t, target, item))
+        hits.sort(key=lambda hit: hit[0])
+        return [(target, item) for _, target, item in hits]
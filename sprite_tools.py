@@ -5,22 +5,41 @@ import pygame
 
 #   Python libraries
 import time
+from collections import OrderedDict
+
+#   Sprite sheets loaded so far, keyed by their constructor arguments
+_sheet_registry = {}
+
+
+def get_sprite_sheet(img_path, sheet_size, frame_num, loader=None):
+    """ Returns a SpriteSheet shared by the whole process, loading and
+    splitting the image only the first time it is asked for. Any number of
+    Sprite objects can play the same shared sheet, so don't call reverse()
+    on one unless every user should see the flipped frames. """
+
+    key = (img_path, tuple(sheet_size), frame_num)
+    if key not in _sheet_registry:
+        _sheet_registry[key] = SpriteSheet(img_path, sheet_size, frame_num, loader)
+    return _sheet_registry[key]
 
 class SpriteSheet(object):
     """ Sprite sheet object for pygame. """
 
-    def __init__(self, img_path, sheet_size, frame_num):
+    def __init__(self, img_path, sheet_size, frame_num, loader=None):
         """ Initializes the spritesheet object. Takes the following arguments:
 
         img_path (str): relative file path for sprite sheet image
         sheet_size (tuple): two items (r, c) for the number of rows and columns
             in the sprite sheet
-        frame_num (int): number of frames in the sprite sheet. """
+        frame_num (int): number of frames in the sprite sheet
+        loader (function): optional, turns img_path into a surface in place of
+            pygame.image.load, such as AssetManager.image """
 
         #   Save input arguments as attributes
         self.img_path = img_path
         self.x_size, self.y_size = sheet_size
         self.frame_num = frame_num
+        self.loader = loader if loader is not None else pygame.image.load
 
         #   Optional parameters
         self.reverse_x = False
@@ -37,7 +56,7 @@ class SpriteSheet(object):
         """ Reads the sprite sheet image file and computes dimensions """
 
         #   Load the image from path as a pygame surface
-        self.sheet_img = pygame.image.load(self.img_path)
+        self.sheet_img = self.loader(self.img_path)
 
         #   Determine surface width and height
         self.sheet_height = self.sheet_img.get_height()
@@ -107,6 +126,81 @@ class SpriteSheet(object):
             return self.frames[min(n, self.frame_num - 1)]
 
 
+class RotationCache(object):
+    """ Pre-rotated copies of a surface, quantized to a fixed number of angle
+    steps. Each step is rotated the first time it is asked for and kept. """
+
+    def __init__(self, surface, steps=360):
+        """ Initializes the cache. Takes the following arguments:
+
+        surface (pygame.Surface): unrotated source image
+        steps (int): number of distinct angles in a full turn """
+
+        self.surface = surface
+        self.steps = steps
+        self.frames = [None] * steps
+
+
+    def get(self, angle):
+        """ Returns the source surface rotated by the nearest quantized step
+        to angle, in degrees counterclockwise. """
+
+        idx = int(round(angle * self.steps / 360)) % self.steps
+        frame = self.frames[idx]
+        if frame is None:
+            frame = pygame.transform.rotate(self.surface, idx * 360 / self.steps)
+            self.frames[idx] = frame
+        return frame
+
+
+    def fill(self):
+        """ Rotates every step up front. """
+
+        for idx in range(self.steps):
+            self.get(idx * 360 / self.steps)
+
+
+class ScaleCache(object):
+    """ Scaled copies of a surface, with sizes rounded to a multiple of a
+    quantum. Once more than max_sizes are kept, the least recently used size
+    is dropped. The copies are shared, so callers set their alpha right
+    before each blit rather than relying on it staying put. """
+
+    def __init__(self, surface, quantum=1, max_sizes=64):
+        """ Initializes the cache. Takes the following arguments:
+
+        surface (pygame.Surface): unscaled source image
+        quantum (int): sizes are rounded to a multiple of this many pixels
+        max_sizes (int): most scaled copies kept at once """
+
+        self.surface = surface
+        self.quantum = quantum
+        self.max_sizes = max_sizes
+        self.frames = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+
+    def get(self, size):
+        """ Returns the source surface scaled to the nearest quantized size
+        to size, a (width, height) pair. """
+
+        quantum = self.quantum
+        key = (max(int(round(size[0] / quantum)) * quantum, 0),
+               max(int(round(size[1] / quantum)) * quantum, 0))
+        frame = self.frames.get(key)
+        if frame is not None:
+            self.frames.move_to_end(key)
+            self.hits += 1
+            return frame
+        self.misses += 1
+        frame = pygame.transform.scale(self.surface, key)
+        self.frames[key] = frame
+        if len(self.frames) > self.max_sizes:
+            self.frames.popitem(last=False)
+        return frame
+
+
 class Sprite(object):
     """ Object for rendering a game sprite onto a screen, using pygame. """
 
@@ -0,0 +1,54 @@
+import pygame
+from collections import OrderedDict
+import constants as c
+
+
+class CachedFont:
+    """ Stands in for a pygame.font.Font, rendering through a TextCache.
+    The surfaces it returns are shared, so they mustn't be drawn on. """
+
+    def __init__(self, cache, name, size):
+        self.cache = cache
+        self.name = name
+        self.size = size
+
+    def render(self, text, antialias, color):
+        return self.cache.render(self.name, self.size, text, color, antialias)
+
+
+class TextCache:
+    """ Rendered text keyed by (font, size, text, color, antialias), so
+    strings that don't change aren't rasterized again every frame. Once the
+    surfaces take more than max_bytes, the least recently used go first. """
+
+    def __init__(self, assets, max_bytes=c.TEXT_CACHE_BYTES):
+        self.assets = assets
+        self.max_bytes = max_bytes
+        self.fonts = {}
+        self.surfaces = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def font(self, name, size):
+        if (name, size) not in self.fonts:
+            self.fonts[(name, size)] = pygame.font.Font(c.fonts_path(name), size)
+        return CachedFont(self, name, size)
+
+    def render(self, name, size, text, color, antialias=True):
+        key = (name, size, text, tuple(color), bool(antialias))
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.surfaces.move_to_end(key)
+            self.hits += 1
+            return surface
+
+        self.misses += 1
+        surface = self.fonts[(name, size)].render(text, antialias, color)
+        surface = self.assets.track(self.assets.convert(surface), "text")
+        self.surfaces[key] = surface
+        self.bytes += self.assets.surface_bytes(surface)
+        while self.bytes > self.max_bytes and len(self.surfaces) > 1:
+            _, old = self.surfaces.popitem(last=False)
+            self.bytes -= self.assets.surface_bytes(old)
+        return surface